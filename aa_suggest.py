@@ -33,11 +33,38 @@ import string
 import random
 import copy
 import os
-
-
-def adaptFilePath(l, key, ruleStyle):
-    """Applied early to fully handle duplicates.
-    For file paths, not necessarily file lines.
+import functools
+import bisect
+import collections
+import hashlib
+import json
+import itertools
+import operator
+import time
+import types
+import signal
+import multiprocessing
+import concurrent.futures
+try:
+    import re._parser as sre_parse
+    import re._compiler as sre_compile
+except ImportError:  # Python < 3.11
+    import sre_parse
+    import sre_compile
+
+__version__ = '0.8.15'
+
+
+@functools.cache
+def compileFilePathRules(ruleStyle, isUnixLine):
+    """(compiled regex, macro, prefix) rules of style and line kind, in order"""
+    return tuple(rule for rule in compileFilePathRuleTable(ruleStyle, isUnixLine) if rule)
+
+
+@functools.cache
+def compileFilePathRuleTable(ruleStyle, isUnixLine):
+    """Build once per style and line kind; sanity checks are done here, not on each match.
+    Aligned with the table for every style: None for rules absent in this one.
     Watch out for bugs: launchpad #1856738
     Do only one capture per regex helper, otherwise diffs will be a mess (will match recursively)
     """
@@ -463,11 +490,1039 @@ def adaptFilePath(l, key, ruleStyle):
 (rf'^/tmp/user/({usersC})/',                                                         '@{uid}',                None,                  'owner'),
 (rf'^/tmp/user/{users}/Temp-({uuidC})/',                                             '@{uuid}',               None,                  'owner'),
     ]
-    lineType = findLineType(l)
-    if lineType != 'UNIX':
+    if not isUnixLine:
         tunables.extend(regexpToMacro)  # tunables come first
         regexpToMacro = tunables
 
+    compiledRules = []
+    for t in regexpToMacro:
+        regexp = t[0]
+        d      = t[1]  # default
+        a      = t[2]  # AppArmor.d
+        prefix = t[3] if len(t) >= 4 else None
+        if not d and not a:
+            raise ValueError('No rule style choices. Check your regexes.')
+        elif 'owner' in (d, a) or prefix not in (None, 'owner', 'deny'):
+            raise ValueError('Looks like an error. Check missing commas in your regex tuples.')
+
+        # Assign chosen style, fallback to default if absent
+        # Always choose default for unix line
+        # Lastly, skip if default is absent
+        if   (ruleStyle == 'default' or \
+              isUnixLine)            and \
+          not d:
+
+            compiledRules.append(None)
+            continue
+
+        elif isUnixLine:
+            macro = d
+
+        elif ruleStyle == 'AppArmor.d' and a:
+            macro = a
+
+        else:
+            macro = d
+
+        compiledRegexp = compileRule('unix' if isUnixLine else 'file', regexp)
+        if   compiledRegexp.groups == 0:
+            raise ValueError('No matching capturing group. Check your regexes.')
+        elif compiledRegexp.groups >= 2:
+            raise NotImplementedError('More than one capturing group is not supported. Check your regexes.')
+
+        compiledRules.append((compiledRegexp, macro, prefix))
+
+    return tuple(compiledRules)
+
+
+def isParsedAsExpected(items):
+    """Parsed regex holds only opcodes and shapes the analysers below know of
+    Parser is private and may change between Python versions; otherwise callers fall back to a full scan
+    """
+    repeatOps = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None))
+    try:
+        for op, av in items:
+            if   op in (sre_parse.LITERAL, sre_parse.NOT_LITERAL, sre_parse.GROUPREF):
+                nested = ()
+                if not isinstance(av, int):
+                    return False
+            elif op in (sre_parse.AT, sre_parse.ANY, sre_parse.CATEGORY):
+                nested = ()
+            elif op == sre_parse.IN:
+                nested = ()
+                if not all(len(item) == 2 for item in av):
+                    return False
+            elif op == sre_parse.SUBPATTERN:
+                nested = (av[3],)
+            elif op == sre_parse.BRANCH:
+                nested = av[1]
+            elif op in repeatOps:
+                nested = (av[2],)
+                if not isinstance(av[0], int) or not isinstance(av[1], int):
+                    return False
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                nested = (av[1],)
+                if not isinstance(av[0], int):
+                    return False
+            elif op == getattr(sre_parse, 'ATOMIC_GROUP', None):
+                nested = (av,)
+            else:
+                return False
+
+            if not all(map(isParsedAsExpected, nested)):
+                return False
+
+    except (TypeError, ValueError, IndexError):
+        return False
+
+    return True
+
+
+def findLiteralPrefixes(regexp_, limit=64):
+    """All literal strings a match of anchored regex must start with; None if unknown.
+    Assertions are skipped, optional parts are expanded, anything else stops the prefix.
+    """
+    def expandItems(items, prefixes):
+        for op, av in items:
+            expanded = []
+            for prefix, isOpen in prefixes:
+                if isOpen:
+                    expanded.extend(expandItem(op, av, prefix))
+                else:
+                    expanded.append((prefix, isOpen))
+
+            prefixes = list(dict.fromkeys(expanded))
+            if len(prefixes) > limit:
+                raise OverflowError
+
+        return prefixes
+
+    def expandItem(op, av, prefix):
+        if   op == sre_parse.LITERAL:
+            result = [(prefix + chr(av), True)]
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            result = [(prefix, True)]  # zero-width
+        elif op == sre_parse.SUBPATTERN and not av[1] and not av[2]:  # no inline flags
+            result = expandItems(av[3], [(prefix, True)])
+        elif op == sre_parse.BRANCH:
+            result = []
+            for alternative in av[1]:
+                result.extend(expandItems(alternative, [(prefix, True)]))
+        elif op in repeatOps and av[0] == 0 and av[1] == 1:  # optional
+            result = [(prefix, True)] + expandItems(av[2], [(prefix, True)])
+        elif op in repeatOps and av[0] >= 1:
+            result = expandItems(av[2], [(prefix, True)])
+            if av[0] != av[1]:
+                result = [(p, False) for p, isOpen in result]
+            else:
+                for i in range(av[0] - 1):
+                    result = expandItems(av[2], result)
+        else:
+            result = [(prefix, False)]
+
+        return result
+
+    repeatOps = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None))
+    parsed = sre_parse.parse(regexp_)
+    if parsed.state.flags & re.IGNORECASE or not isParsedAsExpected(parsed):
+        return None  # literals could match other characters; unknown parse
+
+    parsed = list(parsed)
+    if not parsed or parsed[0] != (sre_parse.AT, sre_parse.AT_BEGINNING):
+        return None  # not anchored
+
+    try:
+        prefixes = expandItems(parsed[1:], [('', True)])
+    except OverflowError:
+        return None
+
+    return {p for p, isOpen in prefixes}
+
+
+def findPathDispatchKey(path_):
+    """Leading segment: '/usr/lib/x' -> '/usr', '@/home/x' -> '@/home', '@{PROC}/1' -> '@{PROC}'"""
+    if   path_.startswith('/'):
+        start = 1
+    elif path_.startswith('@/'):
+        start = 2
+    else:
+        start = 0
+
+    end = path_.find('/', start)
+    if end == -1:
+        return path_
+
+    return path_[:end]
+
+
+# Character classes of segment runs: digits, hex, alphanumerics, word characters
+segmentClassRes = (re.compile(r'\d+'), re.compile(r'[0-9a-fA-F]+'), re.compile(r'[0-9a-zA-Z]+'), re.compile(r'\w+'))
+
+
+@functools.lru_cache(maxsize=4096)
+def classifySegment(segment):
+    """Longest runs of each class in a single path segment"""
+    return tuple(max(map(len, classRe.findall(segment)), default=0) for classRe in segmentClassRes)
+
+
+def classifyPathSegments(path_):
+    """Longest runs of digits, hex, alphanumerics and word characters among segments, split once
+    Numbers, ids, hashes, UUIDs and random tokens could only match if their runs fit
+    """
+    return tuple(map(max, zip(*map(classifySegment, path_.split('/')))))
+
+
+@functools.cache
+def findSegmentRequirements(regexp_):
+    """Runs a match needs from classifyPathSegments(): ((class, minimal length), ...)
+    Only mandatory character classes and repeats of them are counted; nothing is required when unsure
+    """
+    digits = set(string.digits)
+    hexDigits = set(string.hexdigits)
+    alphanumerics = set(string.ascii_letters + string.digits)
+    wordChars = alphanumerics | {'_'}
+
+    def findClass(op, av):
+        if   op == sre_parse.LITERAL:
+            chars = {chr(av)}
+        elif op == sre_parse.IN:
+            chars = set()
+            for itemOp, itemAv in av:
+                if   itemOp == sre_parse.LITERAL:
+                    chars.add(chr(itemAv))
+                elif itemOp == sre_parse.RANGE and itemAv[1] - itemAv[0] < 128:
+                    chars.update(map(chr, range(itemAv[0], itemAv[1] + 1)))
+                elif itemOp == sre_parse.CATEGORY and len(av) == 1:
+                    return findClass(itemOp, itemAv)
+                else:
+                    return None
+        elif op == sre_parse.CATEGORY:
+            return {sre_parse.CATEGORY_DIGIT: 0, sre_parse.CATEGORY_WORD: 3}.get(av)
+        else:
+            return None
+
+        for c, classChars in enumerate((digits, hexDigits, alphanumerics, wordChars)):
+            if chars and chars <= classChars:
+                return c
+
+        return None
+
+    def findItems(items):
+        required = {}
+        for op, av in items:
+            for c, n in findItem(op, av).items():
+                required[c] = max(required.get(c, 0), n)
+
+        return required
+
+    def findItem(op, av):
+        c = findClass(op, av)
+        if c is not None:
+            return {c: 1}
+        elif op in repeatOps and av[0] >= 1:
+            c = findClass(*av[2][0]) if len(av[2]) == 1 else None
+            if c is not None:
+                return {c: av[0]}
+
+            return findItems(av[2])
+        elif op == sre_parse.SUBPATTERN and not av[1] and not av[2]:  # no inline flags
+            return findItems(av[3])
+        elif op == sre_parse.ASSERT:  # must match too
+            return findItems(av[1])
+        elif op == sre_parse.BRANCH:
+            alternatives = [findItems(a) for a in av[1]]
+            required = alternatives[0]
+            for alternative in alternatives[1:]:
+                required = {c: min(n, alternative[c]) for c, n in required.items() if c in alternative}
+
+            return required
+
+        return {}
+
+    repeatOps = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None))
+    parsed = sre_parse.parse(regexp_)
+    if parsed.state.flags & re.IGNORECASE or not isParsedAsExpected(parsed):  # case folding widens classes
+        return ()
+
+    return tuple(sorted(findItems(list(parsed)).items()))
+
+
+def isMeetingRequirements(runs, requirements):
+    """Segment runs are long enough for a match"""
+    for c, n in requirements:
+        if runs[c] < n:
+            return False
+
+    return True
+
+
+def findRequiredLiteral(regexp_):
+    """Longest literal string every match contains; empty if none
+    Assertions are zero-width and do not break the literal
+    """
+    def findItems(items):
+        nonlocal current, longest
+        for op, av in items:
+            if   op == sre_parse.LITERAL:
+                current += chr(av)
+                if len(current) > len(longest):
+                    longest = current
+            elif op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                pass
+            elif op == sre_parse.SUBPATTERN and not av[1] and not av[2]:  # no inline flags
+                findItems(av[3])
+            elif op in repeatOps and av[0] >= 1:  # the first repetition follows
+                findItems(av[2])
+                if av[0] != 1 or av[1] != 1:
+                    current = ''
+            else:
+                current = ''
+
+    repeatOps = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None))
+    current = ''
+    longest = ''
+    parsed = sre_parse.parse(regexp_)
+    if isParsedAsExpected(parsed):
+        findItems(parsed)
+
+    return longest
+
+
+def findMatchingChars(items, state, flags=0):
+    """Characters parsed items could start a match with; out of their own literals and a few usual ones"""
+    def findLiterals(items):
+        for op, av in items[:1]:
+            if   op == sre_parse.LITERAL:
+                yield chr(av)
+            elif op == sre_parse.IN:
+                for itemOp, itemAv in av:
+                    if   itemOp == sre_parse.LITERAL:
+                        yield chr(itemAv)
+                    elif itemOp == sre_parse.RANGE:
+                        yield chr(itemAv[0])
+            elif op == sre_parse.SUBPATTERN:
+                yield from findLiterals(av[3])
+            elif op == sre_parse.BRANCH:
+                for alternative in av[1]:
+                    yield from findLiterals(alternative)
+            elif op in repeatOps:
+                yield from findLiterals(av[2])
+
+    repeatOps = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None))
+    try:
+        itemsRe = sre_compile.compile(sre_parse.SubPattern(state, list(items)), flags)
+    except (re.error, TypeError):  # group references
+        return ''
+
+    literals = findLiterals(list(items)) if isParsedAsExpected(items) else ()  # usual ones only on unknown parse
+
+    return ''.join(dict.fromkeys(c for c in (*literals, *'a0/.-_@{xZ\n ') if itemsRe.match(c)))
+
+
+def findAdversarialInputs(regexp_, flags=0, length=4096):
+    """Inputs near the worst case of a backtracking matcher: the shortest text reaching each unbounded repeat,
+    a long run of a character it consumes, then a tail failing what follows
+    """
+    def findShortest(items):
+        shortest = ''
+        for op, av in items:
+            if   op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                continue
+            elif op == sre_parse.SUBPATTERN:
+                shortest += findShortest(av[3])
+            elif op == sre_parse.BRANCH:
+                shortest += min(map(findShortest, av[1]), key=len)
+            elif op in repeatOps:
+                shortest += findShortest(av[2]) * av[0]
+            elif op == getattr(sre_parse, 'ATOMIC_GROUP', None):
+                shortest += findShortest(av)
+            else:
+                shortest += (findMatchingChars([(op, av)], parsed.state, flags) or 'a')[0]
+
+        return shortest
+
+    def findItems(items, prefix):
+        for op, av in items:
+            if   op in repeatOps:
+                if av[1] == sre_parse.MAXREPEAT:
+                    for c in findMatchingChars(av[2], parsed.state, flags)[:2]:
+                        for tail in ('', '!', '/', '.'):
+                            inputs[prefix + c * length + tail] = None
+
+                findItems(av[2], prefix)
+            elif op == sre_parse.SUBPATTERN:
+                findItems(av[3], prefix)
+            elif op == sre_parse.BRANCH:
+                for alternative in av[1]:
+                    findItems(alternative, prefix)
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                findItems(av[1], prefix)
+            elif op == getattr(sre_parse, 'ATOMIC_GROUP', None):
+                findItems(av, prefix)
+
+            prefix += findShortest([(op, av)])
+
+    repeatOps = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None))
+    parsed = sre_parse.parse(regexp_, flags)
+    inputs = {}
+    findItems(list(parsed), '')
+
+    return tuple(inputs)
+
+
+def findBacktrackingRisks(regexp_, flags=0):
+    """Constructs taking super-linear time on a backtracking matcher; candidates for atomic groups
+    or possessive quantifiers (Python 3.11+): ((reason, repeated items), ...)
+    """
+    def isUnbounded(op, av):
+        return op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and av[1] == sre_parse.MAXREPEAT
+
+    def isContainingUnbounded(items):
+        for op, av in items:
+            if   isUnbounded(op, av):
+                return True
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT) and isContainingUnbounded(av[2]):
+                return True
+            elif op == sre_parse.SUBPATTERN and isContainingUnbounded(av[3]):
+                return True
+            elif op == sre_parse.BRANCH and any(map(isContainingUnbounded, av[1])):
+                return True
+
+        return False
+
+    def findTrailingUnbounded(op, av):
+        if   isUnbounded(op, av):
+            return av
+        elif op == sre_parse.SUBPATTERN and av[3]:
+            return findTrailingUnbounded(*av[3][-1])
+
+        return None
+
+    def isOptional(op, av):
+        if   op in (sre_parse.AT, sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            return True
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+            return av[0] == 0
+        elif op == sre_parse.SUBPATTERN:
+            return all(isOptional(*i) for i in av[3])
+
+        return False
+
+    def findItems(items):
+        backtracking = []  # unbounded repeats earlier in sequence, with optional items since the last one
+        for op, av in items:
+            if isUnbounded(op, av) and isContainingUnbounded(av[2]):
+                risks.append(('nested unbounded repeats', str(av[2])))
+
+            repeatAv = findTrailingUnbounded(op, av)
+            if repeatAv:
+                chars = set(findMatchingChars(repeatAv[2], parsed.state, flags))
+                for previousAv, isAdjacent in backtracking:
+                    if isAdjacent and chars & set(findMatchingChars(previousAv[2], parsed.state, flags)):
+                        risks.append(('adjacent overlapping unbounded repeats', str(repeatAv[2])))
+
+                backtracking = [(previousAv, False) for previousAv, isAdjacent in backtracking]
+                backtracking.append((repeatAv, True))
+            elif op == sre_parse.ASSERT_NOT and av[0] == 1 or op == sre_parse.ASSERT and av[0] == 1:
+                if backtracking and isContainingUnbounded(av[1]):
+                    risks.append(('unbounded lookahead after unbounded repeat', str(av[1])))
+            elif not isOptional(op, av):
+                backtracking = [(previousAv, False) for previousAv, isAdjacent in backtracking]
+
+            if   op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT):
+                findItems(av[2])
+            elif op == sre_parse.SUBPATTERN:
+                findItems(av[3])
+            elif op == sre_parse.BRANCH:
+                for alternative in av[1]:
+                    findItems(alternative)
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                findItems(av[1])
+
+    parsed = sre_parse.parse(regexp_, flags)
+    risks = []
+    findItems(list(parsed))
+
+    return tuple(dict.fromkeys(risks))
+
+
+def iterateRuleRegexps():
+    """Every compiled regex of rule tables, once: (table, compiled regex)"""
+    seen = set()
+    for ruleStyle in ('default', 'AppArmor.d'):
+        for isUnixLine in (False, True):
+            for regexp, macro, prefix in compileFilePathRules(ruleStyle, isUnixLine):
+                if (regexp.pattern, regexp.flags) not in seen:
+                    seen.add((regexp.pattern, regexp.flags))
+                    yield ('unix' if isUnixLine else 'file', regexp)
+
+        for regexp, macro in compileDbusPathRules(ruleStyle):
+            if (regexp.pattern, regexp.flags) not in seen:
+                seen.add((regexp.pattern, regexp.flags))
+                yield ('dbus', regexp)
+
+    sensitivePatterns, volatilePatterns, keywordRe, keywordsImplied = compileHighlightPatterns()
+    for regexp, keyword in sensitivePatterns:
+        yield ('sensitive', regexp)
+
+    for findSpans, requirements in volatilePatterns:
+        if findSpans.func == findGroupSpans:  # not a scanner
+            yield ('volatile', findSpans.args[0])
+
+    for regexp, mask in compileBaseAbstractionRules()[0]:
+        yield ('base', regexp)
+
+
+@functools.cache
+def indexFilePathRules(ruleStyle, isUnixLine):
+    """Dispatch compiled rules by the leading path segment of their literal prefix.
+    Each key holds ascending rule indexes, merged with unanchored (catch-all) ones to keep the order.
+    """
+    rules = compileFilePathRules(ruleStyle, isUnixLine)
+    index, catchAll, keysByRule = indexByDispatchKey([regexp.pattern for regexp, macro, prefix in rules])
+
+    return (rules, index, catchAll, keysByRule)
+
+
+@functools.cache
+def indexJointFilePathRules(ruleStyles, isUnixLine):
+    """indexFilePathRules() for several styles at once, each distinct regex once in table order.
+    Rules are (compiled regex, {style: macro}, macro shared by all styles or None, prefix);
+    styles without the rule are absent from macros.
+    """
+    rules = []
+    for aligned in zip(*(compileFilePathRuleTable(ruleStyle, isUnixLine) for ruleStyle in ruleStyles)):
+        byPattern = {}
+        for ruleStyle, rule in zip(ruleStyles, aligned):
+            if rule:
+                regexp, macro, prefix = rule
+                byPattern.setdefault(regexp.pattern, (regexp, {}, prefix))[1][ruleStyle] = macro
+
+        for regexp, macros, prefix in byPattern.values():
+            isShared = len(macros) == len(ruleStyles) and len(set(macros.values())) == 1
+            rules.append((regexp, macros, next(iter(macros.values())) if isShared else None, prefix))
+
+    index, catchAll, keysByRule = indexByDispatchKey([regexp.pattern for regexp, macros, sharedMacro, prefix in rules])
+
+    return (tuple(rules), index, catchAll, keysByRule)
+
+
+def indexByDispatchKey(regexps):
+    """Regex indexes by the leading path segment of their literal prefix: (index, catch-all, keys by regex)"""
+    catchAll = []
+    buckets = {}
+    for i, regexp in enumerate(regexps):
+        literalPrefixes = findLiteralPrefixes(regexp)
+        keys = set()
+        for literalPrefix in literalPrefixes or ('',):
+            key = findPathDispatchKey(literalPrefix)
+            if key == literalPrefix:  # leading segment is not fully known
+                keys = None
+                break
+
+            keys.add(key)
+
+        if keys:
+            for key in keys:
+                buckets.setdefault(key, []).append(i)
+        else:
+            catchAll.append(i)
+
+    index = {}
+    for key, indexes in buckets.items():
+        index[key] = tuple(sorted(set(indexes + catchAll)))
+
+    keysByRule = [None] * len(regexps)  # None for catch-all
+    for key, indexes in buckets.items():
+        for i in indexes:
+            keysByRule[i] = (keysByRule[i] or ()) + (key,)
+
+    return (index, tuple(catchAll), tuple(keysByRule))
+
+
+# (path, style, is unix line) -> (adapted path, diffs, prefix); least recently used first
+adaptionCache = {'entries': collections.OrderedDict(), 'hits': 0, 'misses': 0, 'maxsize': 8192}
+
+# (table, pattern) -> [hits, misses, seconds]; rule tables are built profiled only when enabled
+ruleProfile = {'isEnabled': False, 'rules': {}}
+
+
+def setRuleProfiling(isEnabled):
+    """Rebuild rule tables with or without profiling, dropping values adapted so far"""
+    ruleProfile['isEnabled'] = isEnabled
+    ruleProfile['rules'].clear()
+    for builder in (compileFilePathRules, compileFilePathRuleTable, indexFilePathRules, indexJointFilePathRules,
+                    adaptPathValueForStyles, generateFilePathAdapter, compileFilePathRulesForBatch,
+                    compileDbusPathRules, adaptDbusPathValue, compileHighlightPatterns,
+                    compileBaseAbstractionRules, isBaseAbstractionPath):
+        builder.cache_clear()
+
+    adaptionCache['entries'].clear()
+
+    return ruleProfile
+
+
+def profileRule(table, name, function):
+    """Same function, recording its hits, misses and time when rule profiling is enabled"""
+    if not ruleProfile['isEnabled']:
+        return function
+
+    stats = ruleProfile['rules'].setdefault((table, name), [0, 0, 0.0])
+    def profiledFunction(*args):
+        start = time.perf_counter()
+        result = function(*args)
+        stats[2] += time.perf_counter() - start
+        stats[0 if result else 1] += 1
+        return result
+
+    return profiledFunction
+
+
+def compileRule(table, pattern, flags=0):
+    """re.compile() for rule tables; duck-typed profiled regex when rule profiling is enabled"""
+    regexp = re.compile(pattern, flags)
+    if not ruleProfile['isEnabled']:
+        return regexp
+
+    return types.SimpleNamespace(
+        pattern=regexp.pattern,
+        groups=regexp.groups,
+        flags=regexp.flags,
+        search=profileRule(table, pattern, regexp.search),
+        match=profileRule(table, pattern, regexp.match),
+        finditer=profileRule(table, pattern, lambda string_: list(regexp.finditer(string_))),
+    )
+
+
+def composeRuleProfile():
+    """Rules ranked by cumulative time; ones never matched are candidates for pruning.
+    Values repeated in logs are answered from caches, not counted again.
+    """
+    ranked = sorted(ruleProfile['rules'].items(), key=lambda t: (-t[1][2], -t[1][0]))
+    report = [f'{"ms":>9} {"hits":>7} {"misses":>8}  {"table":<10} pattern']
+    for (table, pattern), (hits, misses, seconds) in ranked:
+        report.append(f'{seconds * 1000:9.3f} {hits:7} {misses:8}  {table:<10} {pattern}')
+
+    neverMatched = sum(1 for hits, misses, seconds in ruleProfile['rules'].values() if not hits)
+    report.append(f'{len(ranked)} rules, {neverMatched} never matched')
+
+    return '\n'.join(report)
+
+
+# CPU seconds a line may spend in adaption or highlighting, 0 to disable; exceeding lines are shown raw
+lineBudget = {'seconds': 0, 'quarantined': 0}
+
+
+def setLineBudget(seconds):
+    """Interrupt adaption or highlighting of a line after its CPU seconds, even inside a regex match"""
+    lineBudget['seconds'] = seconds
+    lineBudget['quarantined'] = 0
+    signal.signal(signal.SIGVTALRM, raiseLineBudgetExceeded if seconds else signal.SIG_DFL)
+
+    return lineBudget
+
+
+class _LineBudgetExceeded(BaseException):
+    """Not an OSError like TimeoutError, so handlers within the interrupted call can not swallow it"""
+
+
+def raiseLineBudgetExceeded(signum, frame):
+    raise _LineBudgetExceeded('Line processing budget exceeded')
+
+
+def runOnLineBudget(function, *args, lineCount=1):
+    """(is within budget, result) of function on CPU budget of a single line, or of line count lines for batches"""
+    if not lineBudget['seconds']:
+        return (True, function(*args))
+
+    try:
+        signal.setitimer(signal.ITIMER_VIRTUAL, lineBudget['seconds'] * lineCount)
+        try:
+            result = function(*args)
+        finally:
+            signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+    except _LineBudgetExceeded:
+        return (False, None)
+
+    return (True, result)
+
+
+def snapshotLine(l):
+    """Copy to restore the line from; diffs are copied as they are edited in place"""
+    return {k: v.copy() if isinstance(v, list) else v for k, v in l.items()}
+
+
+def quarantineLine(l, raw):
+    """Restore raw values of the line exceeded its budget; zero trust skips further adaption and highlighting"""
+    l.clear()
+    l.update(raw)
+    l['trust'] = 0
+    lineBudget['quarantined'] += 1
+
+    return l
+
+
+# Worker processes adapting and highlighting distinct values in chunks, when enabled
+valueJobs = {'pool': None, 'count': 0, 'minChunkSize': 32, 'maxChunkSize': 1024}
+
+
+def setValueJobs(count):
+    """(Re)create process pool for mapValuesOnJobs(), or shut it down with count below 2.
+    Workers are forked on first use and keep the line budget set at that time
+    """
+    if valueJobs['pool']:
+        valueJobs['pool'].shutdown()
+
+    valueJobs['pool'] = None
+    valueJobs['count'] = count
+    if count > 1:
+        valueJobs['pool'] = concurrent.futures.ProcessPoolExecutor(
+            max_workers=count,
+            mp_context=multiprocessing.get_context('fork'),  # inherits compiled rules and cached adaptions
+            initializer=setLineBudget,  # signal handlers are per process
+            initargs=(lineBudget['seconds'],),
+        )
+
+    return valueJobs
+
+
+def mapValuesOnJobs(chunkFunction, values, *args):
+    """{value: result} of chunk function, given chunks of distinct values and args, on value jobs.
+    Values left out by workers, e.g. exceeding their line budget, are left for the caller
+    """
+    chunkSize = len(values) // (valueJobs['count'] * 4)  # chunks finishing at different times are rebalanced
+    chunkSize = min(max(chunkSize, valueJobs['minChunkSize']), valueJobs['maxChunkSize'])
+    chunks = [values[i:i + chunkSize] for i in range(0, len(values), chunkSize)]
+
+    results = {}
+    for chunkResults in valueJobs['pool'].map(chunkFunction, chunks, *(itertools.repeat(a) for a in args)):
+        results.update(chunkResults)
+
+    return results
+
+
+def adaptValuesChunk(values, ruleStyle, isUnixLine, engine='interpreted'):
+    """Worker side of adaptFilePathsInBatch() on value jobs: {value: (path, diffs, prefix)} within line budget"""
+    isWithinBudget, adaptions = runOnLineBudget(adaptPathValuesInBatch, values, ruleStyle, isUnixLine, lineCount=len(values))
+    if not isWithinBudget:  # only values exceeding their own budget are left out
+        adaptions = mapValuesInChunk(values, adaptPathValue, ruleStyle, isUnixLine, engine)
+
+    return adaptions
+
+
+def mapValuesInChunk(values, function, *args):
+    """Worker side of mapValuesOnJobs(): {value: function(value, *args)}, each value on its line budget"""
+    results = {}
+    for value in values:
+        isWithinBudget, result = runOnLineBudget(function, value, *args)
+        if isWithinBudget:
+            results[value] = result
+
+    return results
+
+
+def explainPath(path_, ruleStyle):
+    """Which rules transform the value, in order: [(table, pattern, old, new, result), ...]
+    Pattern is None for decoding and escaping. DBus rules are tried only if file rules do not apply
+    """
+    isUnixLine = path_.startswith('@')
+    table = 'unix' if isUnixLine else 'file'
+    steps = []
+    prepared = prepareFilePath({'path': path_}, 'path')['path']
+    if prepared != path_:
+        steps.append((table, None, path_, prepared, prepared))
+
+    fileTrace = []
+    applyFilePathRules({'path': path_}, 'path', ruleStyle, isUnixLine, trace=fileTrace)
+    steps.extend((table, *step) for step in fileTrace)
+    if not fileTrace and not isUnixLine:
+        dbusTrace = []
+        applyDbusPathRules({'path': path_}, ruleStyle, trace=dbusTrace)
+        steps.extend(('dbus', *step) for step in dbusTrace)
+
+    return steps
+
+
+def adaptFilePath(l, key, ruleStyle, engine='interpreted'):
+    """Applied early to fully handle duplicates.
+    For file paths, not necessarily file lines.
+    """
+    isUnixLine = findLineType(l) == 'UNIX'
+    if l.get(f'{key}_diffs') or l.get(f'{key}_prefix'):  # already adapted, cached diffs would not apply
+        return applyFilePathRules(l, key, ruleStyle, isUnixLine, engine)
+
+    return applyAdaption(l, key, adaptPathValue(l.get(key), ruleStyle, isUnixLine, engine))
+
+
+def applyAdaption(l, key, adaption):
+    """Set (path, diffs, prefix) result to the line"""
+    path, diffs, prefix = adaption
+    l[key] = path
+    if diffs:
+        l[f'{key}_diffs'] = [[span, d] for span, d in diffs]
+
+    if prefix:
+        l[f'{key}_prefix'] = prefix
+
+    return l
+
+
+def adaptFilePathsInBatch(lineKeyPairs, ruleStyle, batchThreshold=256, engine='interpreted', adaptions=None):
+    """adaptFilePath() for many lines at once; enough uncached values are adapted in a batch.
+    Adaptions already known, e.g. shared by styles, are given as {(value, is unix line): (path, diffs, prefix)}
+    """
+    toBatch = {}  # is unix line -> {value: None}, ordered
+    for l, key in lineKeyPairs:
+        if not (l.get(f'{key}_diffs') or l.get(f'{key}_prefix')):
+            isUnixLine = findLineType(l) == 'UNIX'
+            if (l[key], ruleStyle, isUnixLine) not in adaptionCache['entries'] and \
+               (l[key], isUnixLine) not in (adaptions or {}):
+                toBatch.setdefault(isUnixLine, {})[l[key]] = None
+
+    if lineBudget['seconds']:  # rule tables are built outside of line budgets
+        for isUnixLine in toBatch:
+            if engine == 'generated':
+                generateFilePathAdapter(ruleStyle, isUnixLine)
+            else:
+                indexFilePathRules(ruleStyle, isUnixLine)
+
+    batched = dict(adaptions or {})
+    for isUnixLine, values in toBatch.items():
+        if valueJobs['pool'] and not ruleProfile['isEnabled']:
+            indexFilePathRules(ruleStyle, isUnixLine)  # inherited if workers are yet to be forked
+            if engine == 'generated':
+                generateFilePathAdapter(ruleStyle, isUnixLine)
+
+            adaptions = mapValuesOnJobs(adaptValuesChunk, list(values), ruleStyle, isUnixLine, engine)
+            adaptionCache['misses'] += len(adaptions)
+            for value, adaption in adaptions.items():
+                batched[(value, isUnixLine)] = adaption
+
+        elif len(values) >= batchThreshold and not ruleProfile['isEnabled']:  # batches are not profiled
+            values = list(values)
+            for i in range(0, len(values), batchThreshold):  # exceeding chunk is redone by no more than threshold values
+                chunk = values[i:i + batchThreshold]
+                isWithinBudget, adaptions = runOnLineBudget(adaptPathValuesInBatch, chunk, ruleStyle, isUnixLine, lineCount=len(chunk))
+                if not isWithinBudget:  # values are adapted one by one, each on its line budget
+                    continue
+
+                adaptionCache['misses'] += len(chunk)
+                for value, adaption in adaptions.items():
+                    batched[(value, isUnixLine)] = adaption
+
+    raws = {}  # line id -> values before adaption of its first key
+    for l, key in lineKeyPairs:
+        if l.get('trust') == 0:  # quarantined
+            continue
+
+        if lineBudget['seconds'] and id(l) not in raws:
+            raws[id(l)] = snapshotLine(l)
+
+        adaption = None
+        if batched and not (l.get(f'{key}_diffs') or l.get(f'{key}_prefix')):
+            isUnixLine = findLineType(l) == 'UNIX'
+            adaption = batched.get((l[key], isUnixLine))
+
+        if adaption:
+            cacheKey = (l[key], ruleStyle, isUnixLine)
+            adaptionCache['entries'][cacheKey] = adaption
+            adaptionCache['entries'].move_to_end(cacheKey)
+            isWithinBudget = runOnLineBudget(applyAdaption, l, key, adaption)[0]
+        else:
+            isWithinBudget = runOnLineBudget(adaptFilePath, l, key, ruleStyle, engine)[0]
+
+        if not isWithinBudget:
+            quarantineLine(l, raws[id(l)])
+
+    entries = adaptionCache['entries']
+    while len(entries) > adaptionCache['maxsize']:
+        entries.popitem(last=False)
+
+    return lineKeyPairs
+
+
+def adaptPathValue(path_, ruleStyle, isUnixLine, engine='interpreted'):
+    """Adaption of a single value, cached regardless of the line and key it came from.
+    Returns (path, diffs, prefix); hits and misses are counted in 'adaptionCache'.
+    """
+    cacheKey = (path_, ruleStyle, isUnixLine)
+    entries = adaptionCache['entries']
+    result = entries.get(cacheKey)
+    if result:
+        entries.move_to_end(cacheKey)
+        adaptionCache['hits'] += 1
+
+    else:
+        adaptionCache['misses'] += 1
+        l = applyFilePathRules({'path': path_}, 'path', ruleStyle, isUnixLine, engine)
+        diffs = tuple((span, d) for span, d in l.get('path_diffs', ()))
+        result = (l['path'], diffs, l.get('path_prefix'))
+        entries[cacheKey] = result
+        if len(entries) > adaptionCache['maxsize']:
+            entries.popitem(last=False)  # least recently used
+
+    return result
+
+
+@functools.lru_cache(maxsize=8192)
+def adaptPathValueForStyles(path_, ruleStyles, isUnixLine):
+    """adaptPathValue() for several styles: {style: (path, diffs, prefix)}, uncounted.
+    Styles sharing the path share each search; they walk on separately once their macros differ.
+    """
+    rules, index, catchAll, keysByRule = indexJointFilePathRules(ruleStyles, isUnixLine)
+    prepared = prepareFilePath({'path': path_}, 'path')
+    results = {}
+    walks = [(ruleStyles, prepared['path'], 0, [], None)]  # (styles, path, first rule, events, prefix)
+    while walks:
+        styles, path, start, events, prefix = walks.pop()
+        candidates = index.get(findPathDispatchKey(path), catchAll)
+        c = bisect.bisect_left(candidates, start)
+        while c < len(candidates):
+            i = candidates[c]
+            regexp, macros, sharedMacro, rulePrefix = rules[i]
+            if len(styles) == 1:
+                macro = macros.get(styles[0])
+                if macro is None:  # not a rule of the style
+                    c += 1
+                    continue
+            else:
+                macro = sharedMacro if len(styles) == len(ruleStyles) else None
+
+            whatRe = regexp.search(path)
+            if not whatRe:
+                c += 1
+                continue
+
+            if macro is not None:  # same substitution for every style of the walk
+                path, subSpan, oldDiff = substituteMatch(path, macro, whatRe)
+                events.append((subSpan, oldDiff))
+                prefix = rulePrefix or prefix
+                candidates = index.get(findPathDispatchKey(path), catchAll)
+                c = bisect.bisect_right(candidates, i)
+                continue
+
+            # Styles without the rule go on as if not matched; others by the macro they substitute
+            stylesByMacro = {}
+            for ruleStyle in styles:
+                stylesByMacro.setdefault(macros.get(ruleStyle), []).append(ruleStyle)
+
+            for macro, macroStyles in stylesByMacro.items():
+                if macro is None:
+                    walks.append((tuple(macroStyles), path, i + 1, list(events), prefix))
+                else:
+                    subPath, subSpan, oldDiff = substituteMatch(path, macro, whatRe)
+                    walks.append((tuple(macroStyles), subPath, i + 1, events + [(subSpan, oldDiff)], rulePrefix or prefix))
+
+            break
+
+        else:
+            diffs = prepared.get('path_diffs')
+            if events:
+                diffs = resolvePostcolorizationDiffs(diffs, events)
+
+            for ruleStyle in styles:
+                results[ruleStyle] = (path, tuple((span, d) for span, d in diffs or ()), prefix)
+
+    return results
+
+
+def applyFilePathRules(l, key, ruleStyle, isUnixLine, engine='interpreted', trace=None):
+    """Uncached adaption of a line value in place
+    Trace list is appended with (pattern, old diff, macro, path) for each substitution
+    """
+    prepareFilePath(l, key)
+
+    if engine == 'generated' and trace is None:
+        path, events, prefix = generateFilePathAdapter(ruleStyle, isUnixLine)(l.get(key))
+        l[key] = path
+        if events:
+            l[f'{key}_diffs'] = resolvePostcolorizationDiffs(l.get(f'{key}_diffs'), events)
+
+        if prefix:
+            l[f'{key}_prefix'] = prefix
+
+        return l
+
+    # Attempt to substitute matches in path one by one
+    # Only rules sharing the leading segment could match; re-dispatch after each substitution
+    rules, index, catchAll, keysByRule = indexFilePathRules(ruleStyle, isUnixLine)
+    path = l.get(key)
+    events = []  # resolved once, after all substitutions
+    candidates = index.get(findPathDispatchKey(path), catchAll)
+    c = 0
+    while c < len(candidates):
+        i = candidates[c]
+        regexp, macro, prefix = rules[i]
+        whatRe = regexp.search(path)
+        if whatRe:
+            path, subSpan, oldDiff = substituteMatch(path, macro, whatRe)
+            l[key] = path
+            events.append((subSpan, oldDiff))
+            if trace is not None:
+                trace.append((regexp.pattern, oldDiff, macro, path))
+
+            if prefix:
+                l[f'{key}_prefix'] = prefix
+
+            candidates = index.get(findPathDispatchKey(path), catchAll)
+            c = bisect.bisect_right(candidates, i)
+        else:
+            c += 1
+
+    if events:
+        l[f'{key}_diffs'] = resolvePostcolorizationDiffs(l.get(f'{key}_diffs'), events)
+
+    return l
+
+
+@functools.cache
+def generateFilePathAdapter(ruleStyle, isUnixLine):
+    """Emit and compile a function specialized for rules of style and line kind.
+    Same as the rules loop in applyFilePathRules(): returns (path, [(span, oldDiff), ...], prefix)
+    """
+    rules, index, catchAll, keysByRule = indexFilePathRules(ruleStyle, isUnixLine)
+    namespace = {'findPathDispatchKey': findPathDispatchKey}
+    functionNames = {}
+    source = []
+    for n, (key, candidates) in enumerate([(None, catchAll)] + list(index.items())):
+        functionName = f'rules_{n}'
+        functionNames[key] = functionName
+        source.append(f'def {functionName}(path, start, events, prefix):')
+        for i in candidates:
+            regexp, macro, rulePrefix = rules[i]
+            namespace[f'search_{i}'] = regexp.search
+            source.extend((
+                f'    if start <= {i}:',
+                f'        m = search_{i}(path)',
+                f'        if m:',
+                f'            s, e = m.span(1)',
+                f'            if s < 0:',
+                f'                raise ValueError("No matching capturing group. Check your regexes.")',
+                f'            events.append(((s, {len(macro)} + s), path[s:e]))',
+                f'            path = path[:s] + {macro!r} + path[e:]',
+                f'            return dispatch(path, {i + 1}, events, {rulePrefix!r})' if rulePrefix else \
+                f'            return dispatch(path, {i + 1}, events, prefix)',
+            ))
+
+        source.append('    return (path, events, prefix)')
+        source.append('')
+
+    source.append('functions_byKey = {' + ', '.join(f'{k!r}: {f}' for k, f in functionNames.items() if k is not None) + '}')
+    source.extend((
+        'def dispatch(path, start, events, prefix):',
+        f'    return functions_byKey.get(findPathDispatchKey(path), {functionNames[None]})(path, start, events, prefix)',
+        '',
+        'def adapt(path):',
+        '    return dispatch(path, 0, [], None)',
+    ))
+    exec(compile('\n'.join(source), f'<generated file path adapter: {ruleStyle}, unix={isUnixLine}>', 'exec'), namespace)
+
+    return namespace['adapt']
+
+
+def prepareFilePath(l, key):
+    """Decode and backslash special characters before PCRE replacement"""
+    literalBackslash = '\\\\'
     path = l.get(key)
     hexToString_Out = hexToString(path)
     if hexToString_Out != path:  # changed
@@ -475,6 +1530,15 @@ def adaptFilePath(l, key, ruleStyle):
         l[key] = path
 
     # Backslash special characters after decoding and before PCRE replacement
+    if not l.get(f'{key}_diffs'):  # nothing to shift
+        path, spans = escapePcreChars(path)
+        l[key] = path
+        if spans:
+            l[f'{key}_diffs'] = [[span, ''] for span in spans]
+
+        return l
+
+    events = []
     pcreChars = ('\\', '?', '*', '[', ']', '{', '}', '"', '!', "'", '^')
     for i in pcreChars:
         occurences = range(l.get(key).count(i))
@@ -485,50 +1549,245 @@ def adaptFilePath(l, key, ruleStyle):
                 resultPath = subGroup[0]
                 subSpan = subGroup[1]
                 l[key] = resultPath
-                updatePostcolorizationDiffs(l, subSpan, '', key)
+                events.append((subSpan, ''))
 
-    # Attempt to substitute matches in path one by one
-    for t in regexpToMacro:
-        regexp = t[0]
-        d      = t[1]  # default
-        a      = t[2]  # AppArmor.d
-        if not d and not a:
-            raise ValueError('No rule style choices. Check your regexes.')
+    if events:
+        l[f'{key}_diffs'] = resolvePostcolorizationDiffs(l.get(f'{key}_diffs'), events)
 
-        # Assign chosen style, fallback to default if absent
-        # Always choose default for unix line
-        # Lastly, skip if default is absent
-        if   (ruleStyle == 'default' or \
-              lineType  == 'UNIX')   and \
-          not d:
+    return l
 
-            continue
 
-        elif lineType == 'UNIX':
-            macro = d
+pcreCharRe = re.compile(r'''(?<!\\)[?*\[\]{}"!'^]''')
 
-        elif ruleStyle == 'AppArmor.d' and a:
-            macro = a
 
+def escapePcreChars(path_):
+    """Backslash special characters in one pass: (escaped path, spans of inserted backslashes)
+    Same as substituting one by one: characters already preceded by backslash are kept,
+    backslashes are doubled at the start of the first backslash run
+    """
+    insertions = [(m.start(), 1) for m in pcreCharRe.finditer(path_)]
+    backslashCount = path_.count('\\')
+    if backslashCount:
+        bisect.insort(insertions, (path_.index('\\'), backslashCount))
+
+    parts = []
+    spans = []
+    position = 0
+    for i, count in insertions:
+        start = i + len(spans)
+        parts.append(path_[position:i])
+        parts.append('\\' * count)
+        spans.extend((start + n, start + n + 1) for n in range(count))
+        position = i
+
+    parts.append(path_[position:])
+
+    return (''.join(parts), spans)
+
+
+def isLineBoundRegexp(regexp_):
+    """If regex can't match across or look beyond a newline, so it's usable on a multiline buffer"""
+    def isLineBound(items):
+        for op, av in items:
+            if   op in (sre_parse.LITERAL, sre_parse.GROUPREF):
+                continue
+            elif op == sre_parse.AT:
+                if av in (sre_parse.AT_BEGINNING_STRING, sre_parse.AT_END_STRING):
+                    return False
+            elif op == sre_parse.IN:
+                if (sre_parse.NEGATE, None) in av and (sre_parse.LITERAL, ord('\n')) not in av:
+                    return False
+                for o, a in av:
+                    if o == sre_parse.CATEGORY and a not in (sre_parse.CATEGORY_DIGIT, sre_parse.CATEGORY_WORD):
+                        return False
+            elif op == sre_parse.ANY:
+                continue  # newline is not matched without DOTALL
+            elif op == sre_parse.SUBPATTERN:
+                if av[1] or av[2] or not isLineBound(av[3]):  # inline flags
+                    return False
+            elif op == sre_parse.BRANCH:
+                if not all(isLineBound(a) for a in av[1]):
+                    return False
+            elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, getattr(sre_parse, 'POSSESSIVE_REPEAT', None)):
+                if not isLineBound(av[2]):
+                    return False
+            elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+                if av[0] < 0 or not isLineBound(av[1]):  # lookbehind could see the previous line
+                    return False
+            else:
+                return False
+
+        return True
+
+    parsed = sre_parse.parse(regexp_)
+
+    return not parsed.state.flags & (re.DOTALL | re.MULTILINE) and isParsedAsExpected(parsed) and isLineBound(parsed)
+
+
+@functools.cache
+def compileFilePathRulesForBatch(ruleStyle, isUnixLine):
+    """Multiline variants of compileFilePathRules(); None for rules unsafe to run on a buffer.
+    Line start anchor is replaced with a preceding newline to allow literal prefix search.
+    """
+    compiledRules = []
+    for regexp, macro, prefix in compileFilePathRules(ruleStyle, isUnixLine):
+        pattern = regexp.pattern.replace('[^/]', '[^/\\n]')
+        if isLineBoundRegexp(pattern):
+            if pattern.startswith('^'):
+                pattern = '\n' + pattern.removeprefix('^')
+
+            compiledRules.append(re.compile(pattern, re.MULTILINE))
         else:
-            macro = d
+            compiledRules.append(None)
 
-        path = l.get(key)  # fetch again in case it had changed
-        subGroup = substituteGroup(path, macro, regexp)
-        if subGroup[0]:
-            resultPath = subGroup[0]
-            subSpan = subGroup[1]
-            oldDiff = subGroup[2]
-            l[key] = resultPath
-            updatePostcolorizationDiffs(l, subSpan, oldDiff, key)
-            if len(t) >= 4:
-                l[f'{key}_prefix'] = t[3]
+    return tuple(compiledRules)
 
-    return l
+
+def adaptPathValuesInBatch(paths, ruleStyle, isUnixLine):
+    """Same as adaptPathValue() for many unique values, uncached.
+    Values sharing the leading segment are joined into a newline separated buffer,
+    so each rule scans only the buffers it is dispatched to, once, in rules order.
+    Returns {path: (path, diffs, prefix)}
+    """
+    rules, index, catchAll, keysByRule = indexFilePathRules(ruleStyle, isUnixLine)
+    batchRules = compileFilePathRulesForBatch(ruleStyle, isUnixLine)
+
+    results = {}
+    originals = []
+    states = []
+    groups = {}  # dispatch key -> {state index: None}, ordered
+    for p in paths:
+        l = prepareFilePath({'path': p}, 'path')
+        if '\n' in l['path']:  # would break the buffer
+            results[p] = adaptPathValue(p, ruleStyle, isUnixLine)
+        else:
+            groups.setdefault(findPathDispatchKey(l['path']), {})[len(states)] = None
+            originals.append(p)
+            states.append(l)
+
+    events = [[] for _ in states]  # per state, resolved once after all rules
+    buffers = {}  # dispatch key -> (buffer, line starts, state indexes); dropped on change
+    for (regexp, macro, prefix), batchRegexp, keys in zip(rules, batchRules, keysByRule):
+        matches = []
+        for key in keys or tuple(groups):
+            if key not in groups:
+                continue
+
+            if batchRegexp:
+                if key not in buffers:
+                    indexes = tuple(groups[key])
+                    values = [states[i]['path'] for i in indexes]
+                    lineStarts = list(itertools.accumulate(map((1).__add__, map(len, values)), initial=1))
+                    buffers[key] = ('\n' + '\n'.join(values), lineStarts, indexes)  # every line is preceded by newline
+
+                buffer, lineStarts, indexes = buffers[key]
+                previousLine = -1
+                for m in batchRegexp.finditer(buffer):
+                    line = bisect.bisect_right(lineStarts, m.start(1)) - 1
+                    if line != previousLine:  # only the first match per line, like search()
+                        matches.append((indexes[line], m.start(1) - lineStarts[line], m.end(1) - lineStarts[line], m.group(1)))
+                        previousLine = line
+
+            else:
+                for i in groups[key]:
+                    m = regexp.search(states[i]['path'])
+                    if m:
+                        matches.append((i, m.start(1), m.end(1), m.group(1)))
+
+        # Apply only after scanning, moved values must not be matched twice by the same rule
+        for i, start, end, oldDiff in matches:
+            if oldDiff is None:
+                raise ValueError('No matching capturing group. Check your regexes.')
+
+            l = states[i]
+            path = l['path']
+            oldKey = findPathDispatchKey(path)
+            path = path[:start] + macro + path[end:]
+            l['path'] = path
+            events[i].append(((start, start + len(macro)), oldDiff))
+            if prefix:
+                l['path_prefix'] = prefix
+
+            newKey = findPathDispatchKey(path)
+            buffers.pop(oldKey, None)
+            buffers.pop(newKey, None)
+            if newKey != oldKey:
+                groups[oldKey].pop(i)
+                if not groups[oldKey]:
+                    groups.pop(oldKey)
+
+                groups.setdefault(newKey, {})[i] = None
+
+    for p, l, stateEvents in zip(originals, states, events):
+        if stateEvents:
+            l['path_diffs'] = resolvePostcolorizationDiffs(l.get('path_diffs'), stateEvents)
+
+        diffs = tuple((span, d) for span, d in l.get('path_diffs', ()))
+        results[p] = (l['path'], diffs, l.get('path_prefix'))
+
+    return results
 
 
 def adaptDbusPaths(lines, ruleStyle):
 
+    compileDbusPathRules(ruleStyle)  # outside of line budgets
+    for profile in lines:
+        for l in lines[profile]:
+            if not findLineType(l).startswith('DBUS'):
+                raise ValueError('Using this function to handle non-DBus log lines could lead to silent errors.')
+
+            if not l.get('path') or l.get('trust') == 0:  # skip bind, eavesdrop, etc; and quarantined
+                continue
+
+            raw = snapshotLine(l) if lineBudget['seconds'] else None
+            if not runOnLineBudget(adaptDbusPath, l, ruleStyle)[0]:
+                quarantineLine(l, raw)
+
+    return lines
+
+
+def adaptDbusPath(l, ruleStyle):
+
+    if l.get('path_diffs'):  # shifting onto existing diffs is not cached
+        return applyDbusPathRules(l, ruleStyle)
+
+    path, diffs = adaptDbusPathValue(l.get('path'), ruleStyle)
+    l['path'] = path
+    if diffs:
+        l['path_diffs'] = [[span, oldDiff] for span, oldDiff in diffs]
+
+    return l
+
+
+@functools.lru_cache(maxsize=8192)
+def adaptDbusPathValue(path_, ruleStyle):
+    """(path, style) -> (adapted path, ((span, old diff), ...))"""
+    l = applyDbusPathRules({'path': path_}, ruleStyle)
+
+    return (l['path'], tuple((span, oldDiff) for span, oldDiff in l.get('path_diffs', ())))
+
+
+def applyDbusPathRules(l, ruleStyle, trace=None):
+    """Uncached adaption of DBus path in place"""
+    events = []
+    for regexp, macro in compileDbusPathRules(ruleStyle):
+        whatRe = regexp.search(l.get('path'))
+        if whatRe:
+            subPath, subSpan, oldDiff = substituteMatch(l.get('path'), macro, whatRe)
+            l['path'] = subPath
+            events.append((subSpan, oldDiff))
+            if trace is not None:
+                trace.append((regexp.pattern, oldDiff, macro, subPath))
+
+    if events:
+        l['path_diffs'] = resolvePostcolorizationDiffs(l.get('path_diffs'), events)
+
+    return l
+
+
+@functools.cache
+def compileDbusPathRules(ruleStyle):
+    """Validated (compiled regex, macro) pairs for style"""
     # First capture but not (second) match; 'C' for capture
     Any    = r'(?!@{.+|{.+|\[0-9.+|\*)[^/]+'
     usersC = r'(?:[0-9]|[1-9][0-9]{1,8}|[1-4][0-9]{9})'
@@ -559,30 +1818,24 @@ def adaptDbusPaths(lines, ruleStyle):
 (rf'/loop(\d+)$',                                      '[0-9]*',  '@{int}'),  # unreachable?
     )
 
-    for profile in lines:
-        for l in lines[profile]:
-            if not findLineType(l).startswith('DBUS'):
-                raise ValueError('Using this function to handle non-DBus log lines could lead to silent errors.')
-
-            if not l.get('path'):  # skip bind, eavesdrop, etc
-                continue
+    compiledRules = []
+    for r, d, a in regexpToMacro:
+        if ruleStyle == 'AppArmor.d' and a:
+            macro = a
+        else:
+            macro = d
 
-            for r, d, a in regexpToMacro:
-                if ruleStyle == 'AppArmor.d' and a:
-                    macro = a
-                else:
-                    macro = d
+        compiledRegexp = compileRule('dbus', r)
+        if   compiledRegexp.groups == 0:
+            raise ValueError('No matching capturing group. Check your regexes.')
+        elif compiledRegexp.groups >= 2:
+            raise NotImplementedError('More than one capturing group is not supported. Check your regexes.')
+        elif macro == 'owner':
+            raise ValueError('Looks like an error. Check missing commas in your regex tuples.')
 
-                path = l.get('path')
-                subGroup = substituteGroup(path, macro, r)
-                if subGroup[0]:
-                    subPath = subGroup[0]
-                    subSpan = subGroup[1]
-                    oldDiff = subGroup[2]
-                    l['path'] = subPath
-                    updatePostcolorizationDiffs(l, subSpan, oldDiff, 'path')
+        compiledRules.append((compiledRegexp, macro))
 
-    return lines
+    return tuple(compiledRules)
 
 
 def findTempTailPair(filename, ruleStyle):
@@ -617,16 +1870,9 @@ def findTempTailPair(filename, ruleStyle):
     return (tempTail, macro)
 
 
-def highlightWords(string_, isHighlightVolatile=True):
-    """Sensitive words should not have false-positives, volatile words are expected to have false-positives
-    Volatile is for those paths which could not be unequivocally normalized
-    Repeating, non-positional patterns must be greedy
-    Capturing group is the highlight
-    """
-    ignorePath = '/usr/share'
-
-    grn  = r'\x1b\[0;32m' # (escaped) regular green
-    rst  = r'\x1b\[0m'    # (escaped) reset
+@functools.cache
+def compileHighlightPatterns():
+    """Sensitive patterns and volatile patterns with segment runs they need, compiled once"""
     proc = '@{PROC}'
     pids = '@{pids?}'
 
@@ -641,8 +1887,8 @@ def highlightWords(string_, isHighlightVolatile=True):
         r'(?<!over|fore)(?<!be)(shadow)(?!coord|graph|iest|like|less|map|ing|ily|ers|box|ier|er|ed|y|s)', # only shadow; NOT: foreshadow, shadows, etc
         r'(?<!na|sa|ac)(cred)(?!ulous|ulity|uliti|enza|ence|ibl|ibi|al|it|o)', # only cred, creds, credentials; NOT: sacred, credence, etc
         r'(?:/|^)(0)(?:/|$)', # standalone zero: 0, /0, /0/; NOT: a0, 0a, 01, 10, 101, etc
-       rf'^(?:/proc|{proc}|{grn}{proc}{rst})/(1)/',
-       rf'^(?:/proc|{proc}|{grn}{proc}{rst})(?:/\d+|/(?:{grn}{pids}{rst}|{pids}))?/(cmdline)$',
+       rf'^(?:/proc|{proc})/(1)/',
+       rf'^(?:/proc|{proc})(?:/\d+|/{pids})?/(cmdline)$',
         r'(cookies)\.sqlite(?:-wal)?$',
         r'(cookiejar)',
         )
@@ -660,45 +1906,129 @@ def highlightWords(string_, isHighlightVolatile=True):
        rf'/(?:var/)?tmp/({random10})(?:/|$)',
         r'[-.](?![0-9]{8}|[a-z]{8})([0-9a-z]{8})\.log$',
         r'[-.](?![0-9]{8}|[A-Z]{8})([0-9A-Z]{8})\.log$',
-        r'(?=[^0-9a-fA-F]0x([0-9a-fA-F]{16})(?:[^0-9a-fA-F]|$))', # hex address
-        r'(?=[^0-9a-fA-F]([0-9a-fA-F]{32})(?:[^0-9a-fA-F]|$))',   # standalone MD5
-        r'(?=[^0-9a-fA-F]([0-9a-fA-F]{38})(?:[^0-9a-fA-F]|$))',   # ??
-        r'(?=[^0-9a-fA-F]([0-9a-fA-F]{56})(?:[^0-9a-fA-F]|$))',   # standalone SHA224
-        r'(?=[^0-9a-fA-F]([0-9a-fA-F]{64})(?:[^0-9a-fA-F]|$))',   # standalone SHA256
-        r'(?=[^0-9a-fA-F]([0-9a-fA-F]{96})(?:[^0-9a-fA-F]|$))',   # standalone SHA384
-        r'(?=[^0-9a-fA-F]([0-9a-fA-F]{128})(?:[^0-9a-fA-F]|$))',  # standalone SHA512
-        r'(?=[^0-9a-fA-F]([0-9a-fA-F]{8}[-_][0-9a-fA-F]{4}[-_][0-9a-fA-F]{4}[-_][0-9a-fA-F]{4}[-_][0-9a-fA-F]{12})(?:[^0-9a-fA-F]|$))', # standalone UUID
+        findHexRunSpans,  # hex address, standalone MD5, SHA* and UUID
         r'^@?/home/([^/]+)/', # previously unmatched homes
         r'/python\d(?:\.\d+|\.\[0-9\]\{\,\[0-9\]\}|\.@\{int\})?/dist-packages/([^/]+)/',
         r'/\.mozilla/firefox/(\w{8})\.default',
     )
 
-    if not string_.startswith(ignorePath):
-        for r in sensitivePatterns:
-            allSpans = []
-            sensitiveRe = re.finditer(r, string_, re.I)
-            for m in sensitiveRe:
-                allSpans.append(m.span(1))
-    
-            # Begin from the end to mitigate colorization shifting
-            allSpans.sort(reverse=True)
-    
-            for s in allSpans:
-                string_ = colorizeBySpan(string_, 'Red', s)
-    
-        if isHighlightVolatile:
-            for r in volatilePatterns:
-                allSpans = []
-                volatileRe = re.finditer(r, string_)
-                for m in volatileRe:
-                    allSpans.append(m.span(1))
-     
-                allSpans.sort(reverse=True)
-     
-                for s in allSpans:
-                    string_ = colorizeBySpan(string_, 'Yellow', s)
+    compiledSensitive = tuple((compileRule('sensitive', r, re.I), findRequiredLiteral(r).lower()) for r in sensitivePatterns)
+    compiledVolatile = []
+    for r in volatilePatterns:
+        if callable(r):  # scanner
+            compiledVolatile.append((functools.partial(findScannerSpans, profileRule('volatile', r.__name__, r)), ((1, 12),)))
+        else:
+            compiledVolatile.append((functools.partial(findGroupSpans, compileRule('volatile', r)), findSegmentRequirements(r)))
+
+    # Keywords are found in one pass over lowercased string, overlapping ones too
+    # Only one keyword could match at a position, so it also stands for keywords it starts with
+    keywords = sorted({k for r, k in compiledSensitive if k}, key=len, reverse=True)
+    keywordRe = re.compile('(?=(' + '|'.join(map(re.escape, keywords)) + '))')
+    keywordsImplied = {k: frozenset(i for i in keywords if k.startswith(i)) for k in keywords}
+
+    return (compiledSensitive, tuple(compiledVolatile), keywordRe, keywordsImplied)
+
+
+def highlightWords(string_, isHighlightVolatile=True):
+    """Sensitive words should not have false-positives, volatile words are expected to have false-positives
+    Volatile is for those paths which could not be unequivocally normalized
+    Repeating, non-positional patterns must be greedy
+    Capturing group is the highlight
+    Colorized input is decolorized first; all spans are found on plain string and rendered at once
+    """
+    plain, coloredSpans = decolorizeToSpans(string_)
+
+    return colorizeBySpans(plain, coloredSpans + findHighlightSpans(plain, isHighlightVolatile))
+
+
+def findHighlightSpans(string_, isHighlightVolatile=True):
+    """Colored spans of sensitive, then volatile words in plain string
+    Matches running over already highlighted words are dropped, whole.
+    Patterns see the plain neighbours of highlighted words: a lookaround or hex run could go on
+    into a word highlighted before, e.g. 'shadow' is not highlighted in 'shadowsecret'
+    """
+    def addSpans(spans, color):
+        newSpans = []
+        for (matchStart, matchEnd), groupSpan in spans:
+            if not any(matchStart < e and s < matchEnd for (s, e), c in coloredSpans):
+                newSpans.append((groupSpan, color))
+
+        coloredSpans.extend(newSpans)
+
+    ignorePath = '/usr/share'
+    sensitivePatterns, volatilePatterns, keywordRe, keywordsImplied = compileHighlightPatterns()
+
+    coloredSpans = []
+    if not string_.startswith(ignorePath):
+        keywords = findHighlightKeywords(string_, keywordRe, keywordsImplied)
+        for r, keyword in sensitivePatterns:
+            if keyword and keywords is not None and keyword not in keywords:  # contextual regex could not match
+                continue
+
+            addSpans(findGroupSpans(r, string_), 'Red')
+
+        if isHighlightVolatile:
+            runs = classifyPathSegments(string_)
+            for findSpans, requirements in volatilePatterns:
+                if not isMeetingRequirements(runs, requirements):  # segments are too short
+                    continue
+
+                addSpans(findSpans(string_), 'Yellow')
+
+    return coloredSpans
+
+
+def findGroupSpans(regexp_, string_):
+    """(match span, capturing group span) for all matches"""
+    return [(m.span(), m.span(1)) for m in regexp_.finditer(string_)]
+
+
+def findScannerSpans(scanner, string_):
+    """Scanned spans as (match span, capturing group span)"""
+    return [(s, s) for s in scanner(string_)]
+
+
+hexRunRe = re.compile(r'[0-9a-fA-F]+')
+
+
+def findHexRunSpans(string_):
+    """Standalone hex address, MD5, SHA* and UUID spans from maximal hex runs, in one scan
+    Runs must follow some non-hex character
+    """
+    hashLengths = (32, 38, 56, 64, 96, 128)
+    uuidLengths = (8, 4, 4, 4, 12)
+    runs = [m.span() for m in hexRunRe.finditer(string_)]
+    spans = []
+    for n, (start, end) in enumerate(runs):
+        if start == 0:
+            continue
+
+        length = end - start
+        if   length in hashLengths:
+            spans.append((start, end))
+        elif length == 16 and start >= 3 and string_[start - 1] == 'x' and runs[n - 1] == (start - 2, start - 1) and string_[start - 2] == '0':
+            spans.append((start, end))  # 0x prefixed address
+        elif length == 8 and n + 4 < len(runs):
+            uuidRuns = runs[n:n + 5]
+            for (s, e), (nextStart, nextEnd), nextLength in zip(uuidRuns, uuidRuns[1:], uuidLengths[1:]):
+                if nextStart != e + 1 or string_[e] not in '-_' or nextEnd - nextStart != nextLength:
+                    break
+            else:
+                spans.append((start, uuidRuns[-1][1]))
+
+    return spans
 
-    return string_
+
+def findHighlightKeywords(string_, keywordRe, keywordsImplied):
+    """Keywords of sensitive patterns present in string; None if unknown"""
+    if not string_.isascii():  # case-insensitive matching folds some other characters to ASCII
+        return None
+
+    keywords = set()
+    for k in keywordRe.findall(string_.lower()):
+        keywords.update(keywordsImplied[k])
+
+    return keywords
 
 
 def findExecType(path):
@@ -790,6 +2120,28 @@ def adaptProfileAutoTransitions(l):
 
 def isBaseAbstractionTransition(l, profile_):
     """Only for file lines. Must be done after normalization and before adaption. Temporary solution?"""
+    result = False
+    if '▶' in profile_ or isTransitionComm(l.get('comm')):  # transition features
+        result = isBaseAbstractionPath(l.get('path'), frozenset(l.get('mask')))
+
+    return result
+
+
+@functools.lru_cache(maxsize=8192)
+def isBaseAbstractionPath(path_, mask):
+    """Frozen mask of path is covered by base abstraction"""
+    rules, index, catchAll = compileBaseAbstractionRules()
+    for i in index.get(findPathDispatchKey(path_), catchAll):
+        regexp, allowedMask = rules[i]
+        if mask <= allowedMask and regexp.match(path_):
+            return True
+
+    return False
+
+
+@functools.cache
+def compileBaseAbstractionRules():
+    """Compiled base abstraction rules with immutable masks, indexed by leading path segment"""
     multiarch   = r'(?:[^/]+-linux-(?:gnu|musl)(?:[^/]+)?|@{multiarch})'
     proc        = r'(?:/proc|@{PROC})'
     etc_ro      = r'(?:/usr/etc|/etc|@{etc_ro})'
@@ -857,23 +2209,16 @@ def isBaseAbstractionTransition(l, profile_):
        rf'^/(etc/|usr/share/)crypto-policies/[^/]+/[^/]+\.txt$': {'r'},
     }
 
-    result = False
-    if '▶' in profile_ or isTransitionComm(l.get('comm')):  # transition features
-        path      = l.get('path')
-        pathMasks = l.get('mask')
-        for regex, mask in baseAbsRules.items():
-            if 'a' in pathMasks and \
-               'w' in mask:     # 'w' consumes 'a'
+    rules = []
+    for regex, mask in baseAbsRules.items():
+        if 'w' in mask:  # 'w' consumes 'a'
+            mask = mask | {'a'}
 
-                mask.add('a')
+        rules.append((compileRule('base', regex), frozenset(mask)))
 
-            if re.match(regex, path)   and \
-               pathMasks.issubset(mask):
- 
-                result = True
-                break
+    index, catchAll, keysByRule = indexByDispatchKey(baseAbsRules)
 
-    return result
+    return (tuple(rules), index, catchAll)
 
 
 def findBootId(positionalId):
@@ -883,7 +2228,8 @@ def findBootId(positionalId):
     return None
 
 
-def grabJournal(args):
+def grabJournal(args, cursor=None):
+    """Matching journal entries after the cursor, if any, and the cursor of the last read entry"""
 
     if not args.keep_status_audit:
         statusTypes = '(?:AVC |USER_AVC )?apparmor="?(ALLOWED|DENIED)'
@@ -903,12 +2249,19 @@ def grabJournal(args):
                 'SYSLOG_IDENTIFIER=audit',
                 'SYSLOG_IDENTIFIER=dbus-daemon')  # try to limit spoofing surface
 
+    if cursor:
+        j.seek_cursor(cursor)  # continue from the previously read entry
+
     rawLines = []
     for entry in j:
+        if entry['__CURSOR'] == cursor:
+            continue
+
+        cursor = entry['__CURSOR']
         if re.search(statusTypes, entry['MESSAGE']):
             rawLines.append(entry)
 
-    return rawLines
+    return (rawLines, cursor)
 
 
 def isDbusJournalLine(entry):
@@ -1043,16 +2396,8 @@ def normalizeJournalLine(rawLine, args):
         if   key in toSkipKeys:
             continue
 
-        elif key == 'name' and \
-             re.match(r':\d+\.\d+', val):
-
-            if args.style == 'AppArmor.d':
-                pcreStyle = '.@{int}'
-            else:
-                pcreStyle = '.[0-9]*'
-
-            adaptedName = re.sub(r'\.\d+$', pcreStyle, val)
-            lineDict.update({key: adaptedName})
+        elif key == 'name' and val:
+            lineDict.update({key: normalizeBusName(val, args.style)})
 
         elif val:
             lineDict.update({key: val})
@@ -1060,6 +2405,22 @@ def normalizeJournalLine(rawLine, args):
     return (lineDict, trust)
 
 
+@functools.lru_cache(maxsize=4096)
+def normalizeBusName(name, ruleStyle):
+    """Unique connection name ':1.234' to ':1.[0-9]*' or ':1.@{int}'; other names are kept.
+    Names already normalized in default style are converted
+    """
+    if not re.match(r':\d+\.(?:\d+|\[0-9\]\*)', name):
+        return name
+
+    if ruleStyle == 'AppArmor.d':
+        pcreStyle = '.@{int}'
+    else:
+        pcreStyle = '.[0-9]*'
+
+    return re.sub(r'\.(?:\d+|\[0-9\]\*)$', pcreStyle, name)
+
+
 def normalizeProfileName(l):
     """Dealing early with regular operation format (string)"""
     if l.get('operation').startswith('dbus'):
@@ -1165,21 +2526,23 @@ def composeSuffix(l, keysToHide):
     return s
 
 
+colorTable = {
+    'Black':          '30', 'Bright Black':   '90',
+    'Red':            '31', 'Bright Red':     '91',
+    'Green':          '32', 'Bright Green':   '92',
+    'Yellow':         '33', 'Bright Yellow':  '93',
+    'Blue':           '34', 'Bright Blue':    '94',
+    'Magenta':        '35', 'Bright Magenta': '95',
+    'Cyan':           '36', 'Bright Cyan':    '96',
+    'White':          '37', 'Bright White':   '97',
+}
+colorizedRe = re.compile(r'\033\[(\d);(\d{2})m(.*?)\033\[0m', re.S)
+
+
 def colorize(string_, color, style='0'):
     """https://en.wikipedia.org/wiki/ANSI_escape_code#Colors
     No nested colorization
     """
-    colorTable = {
-        'Black':          '30', 'Bright Black':   '90',
-        'Red':            '31', 'Bright Red':     '91',
-        'Green':          '32', 'Bright Green':   '92',
-        'Yellow':         '33', 'Bright Yellow':  '93',
-        'Blue':           '34', 'Bright Blue':    '94',
-        'Magenta':        '35', 'Bright Magenta': '95',
-        'Cyan':           '36', 'Bright Cyan':    '96',
-        'White':          '37', 'Bright White':   '97',
-    }
-
     if not color in colorTable:
         raise ValueError(f'Incorrect color specified: {color}')
 
@@ -1188,16 +2551,49 @@ def colorize(string_, color, style='0'):
     return string_
 
 
-def colorizeBySpan(string_, color, span_):
+def colorizeBySpans(string_, coloredSpans):
+    """Render [(span, color[, style]), ...] at once; earlier spans win overlaps"""
+    accepted = []
+    for item in coloredSpans:
+        start, end = item[0]
+        if not any(start < e and s < end for (s, e), *colorAndStyle in accepted):
+            accepted.append(item)
 
-    prefix = string_[:span_[0]]
-    macro  = string_[span_[0]:span_[1]]
-    suffix = string_[span_[1]:]
+    accepted.sort(key=lambda item: item[0])
 
-    colorizedPart = colorize(macro, color)
-    string_ = prefix + colorizedPart + suffix
+    parts = []
+    position = 0
+    for (start, end), *colorAndStyle in accepted:
+        parts.append(string_[position:start])
+        parts.append(colorize(string_[start:end], *colorAndStyle))
+        position = end
 
-    return string_
+    parts.append(string_[position:])
+
+    return ''.join(parts)
+
+
+def decolorizeToSpans(string_):
+    """Reverse colorize(): plain string and [(span, color, style), ...]"""
+    colorByCode = {v: k for k, v in colorTable.items()}
+    coloredSpans = []
+    parts = []
+    position = 0
+    plainLength = 0
+    for m in colorizedRe.finditer(string_):
+        if m.group(2) not in colorByCode:
+            continue
+
+        parts.append(string_[position:m.start()])
+        plainLength += m.start() - position
+        parts.append(m.group(3))
+        coloredSpans.append(((plainLength, plainLength + len(m.group(3))), colorByCode[m.group(2)], m.group(1)))
+        plainLength += len(m.group(3))
+        position = m.end()
+
+    parts.append(string_[position:])
+
+    return (''.join(parts), coloredSpans)
 
 
 def highlightSpecialChars(string_):
@@ -1217,61 +2613,61 @@ def highlightSpecialChars(string_):
     return string_
 
 
+hexStringRe = re.compile(r'(@?)((?:[0-9a-fA-F]{2})*)')  # unix addr could lead with '@'
+
+
+@functools.lru_cache(maxsize=8192)
 def hexToString(path_):
     """For whitespaces and localized paths"""
-    # unix addr
-    if path_.startswith('@'):
-        path_ = path_.removeprefix('@')
-        isLeadingAt = True
-    else:
-        isLeadingAt = False
-
-    for c in path_:
-        if c not in string.hexdigits:
-            break
-    else:
-        try:
-            path_ = bytes.fromhex(path_).decode('utf-8')
-            while path_.endswith('\x00'):  # trim trailing zeroes
-                path_ = path_.removesuffix('\x00')
-        except:
-            pass  # not utf-8
+    hexString = hexStringRe.fullmatch(path_)
+    if not hexString:
+        return path_
 
-    if isLeadingAt:
-        path_ = '@' + path_
+    try:
+        decoded = bytes.fromhex(hexString.group(2)).decode('utf-8')
+    except UnicodeDecodeError:
+        return path_  # not utf-8
 
-    return path_
+    return hexString.group(1) + decoded.rstrip('\x00')  # trim trailing zeroes
 
 
 def substituteGroup(subWhat, subWith, regexp_):
     """Substitute the capturing group"""
     whatRe = re.search(regexp_, subWhat)
     if whatRe:
-        if   len(whatRe.groups()) == 0 or whatRe.group(1) is None:
+        if   len(whatRe.groups()) == 0:
             raise ValueError('No matching capturing group. Check your regexes.')
         elif len(whatRe.groups()) >= 2:
             raise NotImplementedError('More than one capturing group is not supported. Check your regexes.')
         elif subWith == 'owner':
             raise ValueError('Looks like an error. Check missing commas in your regex tuples.')
-#        elif whatRe.group(1).startswith('@{') or \
-#             whatRe.group(1).startswith('{')  or \
-#             whatRe.group(1).startswith('['):
-#            print('Second attempt to capture an already substituted match. This is unnecessary and will lead to malformed diffs. Check your regexes.', file=sys.stderr)
-#            print(whatRe,          file=sys.stderr)
-#            print(whatRe.group(1), file=sys.stderr)
-
-        oldDiff = whatRe.group(1)
-        span = whatRe.span(1)
-        pathPrefix = subWhat[:span[0]]
-        pathSuffix = subWhat[span[1]:]
-        adjustedEndIndex = span[0] + len(subWith)
-        span = (span[0], adjustedEndIndex)
-        resultPath = pathPrefix + subWith + pathSuffix
+
+        result = substituteMatch(subWhat, subWith, whatRe)
 
     else:
-        resultPath = None
-        span       = None
-        oldDiff    = None
+        result = (None, None, None)
+
+    return result
+
+
+def substituteMatch(subWhat, subWith, match_):
+    """Substitute the capturing group of an already validated match"""
+    if match_.group(1) is None:
+        raise ValueError('No matching capturing group. Check your regexes.')
+#    elif match_.group(1).startswith('@{') or \
+#         match_.group(1).startswith('{')  or \
+#         match_.group(1).startswith('['):
+#        print('Second attempt to capture an already substituted match. This is unnecessary and will lead to malformed diffs. Check your regexes.', file=sys.stderr)
+#        print(match_,          file=sys.stderr)
+#        print(match_.group(1), file=sys.stderr)
+
+    oldDiff = match_.group(1)
+    span = match_.span(1)
+    pathPrefix = subWhat[:span[0]]
+    pathSuffix = subWhat[span[1]:]
+    adjustedEndIndex = span[0] + len(subWith)
+    span = (span[0], adjustedEndIndex)
+    resultPath = pathPrefix + subWith + pathSuffix
 
     return (resultPath, span, oldDiff)
 
@@ -1280,17 +2676,51 @@ def updatePostcolorizationDiffs(l, currentSpan, currentDiff, key):
     """After each replacement in path, spans determined for colorization can and will shift, breaking the colorization.
     Such cases are being adjusted here.
     """
-    diffs = l.get(f'{key}_diffs')
-    if diffs:
+    l[f'{key}_diffs'] = resolvePostcolorizationDiffs(l.get(f'{key}_diffs'), ((currentSpan, currentDiff),))
+
+    return l
+
+
+def resolvePostcolorizationDiffs(diffs, events):
+    """Final diffs after substitutions, given in order as ((span, old diff), ...), were made over present diffs.
+    Every substitution is a piecewise shift: items to the right of its span move by its length change.
+    Resolved at once; coinciding spans take the order dependent path.
+    """
+    items = [[span, d] for span, d in diffs or ()]
+    for span, oldDiff in events:
+        padding = span[1] - span[0] - len(oldDiff)
+        for item in items:
+            if item[0] >= span:
+                if item[0] == span:
+                    return replayPostcolorizationDiffs(diffs, events)
+
+                if padding:
+                    item[0] = (item[0][0] + padding, item[0][1] + padding)
+
+        items.append([span, oldDiff])
+
+    items.sort(key=lambda t: t[0])
+    for previous, item in zip(items, items[1:]):
+        if previous[0] == item[0]:
+            return replayPostcolorizationDiffs(diffs, events)
+
+    return items
+
+
+def replayPostcolorizationDiffs(diffs, events):
+    """Shift diffs one substitution at a time, keeping the order of items with equal spans"""
+    diffs = [[span, d] for span, d in diffs or ()]
+    for currentSpan, currentDiff in events:
+        if not diffs:  # no problems on first replacement
+            diffs = [[currentSpan, currentDiff]]
+            continue
+
         # Determine the shift padding
-        oldLen = len(currentDiff)
-        newLen = currentSpan[1] - currentSpan[0]
-        padding = newLen - oldLen
+        padding = currentSpan[1] - currentSpan[0] - len(currentDiff)
 
         # Add new diff to already present ones and sort by span
         currentItem = [currentSpan, currentDiff]
-        diffs.append(currentItem)
-        sortedDiffs = sorted(diffs, key=lambda t: t[0])
+        sortedDiffs = sorted(diffs + [currentItem], key=lambda t: t[0])
 
         # Slice sorted list of diffs by current item
         currentIndex = sortedDiffs.index(currentItem)
@@ -1299,18 +2729,12 @@ def updatePostcolorizationDiffs(l, currentSpan, currentDiff, key):
 
         # Only elements to the right need to be shifted
         for s, d in rightDiffs:
-            newSpan = (s[0] + padding, s[1] + padding)
-            leftDiffs.append([newSpan, d])
+            leftDiffs.append([(s[0] + padding, s[1] + padding), d])
 
         leftDiffs.append(currentItem)  # preserve current item
-        resultDiffs = sorted(leftDiffs, key=lambda t: t[0])  # sort again for tests sake
-        l[f'{key}_diffs'] = resultDiffs
-
-    # No problems on first replacement
-    else:
-        l[f'{key}_diffs'] = [[currentSpan, currentDiff]]
+        diffs = sorted(leftDiffs, key=lambda t: t[0])
 
-    return l
+    return diffs
 
 
 def findLineType(l):
@@ -1492,17 +2916,24 @@ def composeMembers(lines):
     """Sort and encase DBus members. Expected after processing and before line sorting"""
     for profile in lines:
         for l in lines[profile]:
-            if l.get('member'):
-                if len(l.get('member')) >= 2:
-                    membersList = sorted(l.pop('member'))
-                    members = ','.join(membersList)
-                    l['member'] = '{%s}' % members
-                elif l.get('member'):
-                    l['member'] = '_BUG_'.join(l.pop('member'))
+            composeMember(l)
 
     return lines
 
 
+def composeMember(l):
+
+    if l.get('member'):
+        if len(l.get('member')) >= 2:
+            membersList = sorted(l.pop('member'))
+            members = ','.join(membersList)
+            l['member'] = '{%s}' % members
+        elif l.get('member'):
+            l['member'] = '_BUG_'.join(l.pop('member'))
+
+    return l
+
+
 def groupLinesByProfile(lines):
     """Group all profile-related log lines as list-value under each profile as key"""
     profiles = []
@@ -1546,174 +2977,17 @@ def makeHashable(l):
 
 def mergeDictsBySingleKey(lines, key):
     """Merge dictionaries if specified key is the only difference, preserving both keys"""
-    newDictOfListsOfLines_byProfile = {}
-    for profile in lines:
-        differences_byId = {}
-        suffixes_byId = {}
-        newLogLines_forProfile = []
-        for l in lines[profile]:
-            if not l.get(key):
-                newLogLines_forProfile.append(l)  # save non-mergable
-                continue
-
-            if 'file_inherit' in l.get('operation'):
-                newLogLines_forProfile.append(l)
-                continue
-
-            diff = l.pop(key)
-            if not isinstance(diff, set):
-                raise NotImplementedError('Could merge diff sets only')
-
-            timestamp = l.pop('timestamp')
-            lineId    = makeHashable(l)
-            if not lineId in differences_byId:
-                differences_byId[lineId] = diff
-            else:
-                differences_byId[lineId].update(diff)
-
-            suffix = l  # leftovers
-            suffix['timestamp'] = timestamp  # use only the latest timestamp for duplicates
-            suffixes_byId[lineId] = suffix
-
-        for lineId, merged in differences_byId.items():
-            logLine = suffixes_byId.get(lineId)
-            logLine[key] = merged
-            newLogLines_forProfile.append(logLine)
-
-        newDictOfListsOfLines_byProfile[profile] = newLogLines_forProfile
-
-    return newDictOfListsOfLines_byProfile
+    return mergeLinesBySpec(lines, ({'unioned': (key,)},))
 
 
 def mergeDictsByKeyPair(lines, firstKey, secondKey):
 
-    newDictOfListsOfLines_byProfile = {}
-    for profile in lines:
-        newLogLines_forProfile = []
-        pair_byId = {}
-        suffixes_byId = {}
-        for l in lines[profile]:
-            if not l.get(firstKey) or \
-               not l.get(secondKey):
-                newLogLines_forProfile.append(l)  # save non-mergable
-                continue
-
-            if 'file_inherit' in l.get('operation'):
-                newLogLines_forProfile.append(l)
-                continue
-
-            firstVal  = l.pop(firstKey)
-            secondVal = l.pop(secondKey)
-            if not isinstance(firstVal,  set) or \
-               not isinstance(secondVal, set):
-                raise NotImplementedError('Could merge diff sets only')
-
-            timestamp = l.pop('timestamp')
-            lineId = makeHashable(l)
-            if not lineId in pair_byId:
-                pair_byId[lineId] = [firstVal, secondVal]
-
-            else:
-                sublist = pair_byId.get(lineId)
-                mergedFirstVals  = sublist[0]
-                mergedSecondVals = sublist[1]
-                mergedFirstVals.update(firstVal)
-                mergedSecondVals.update(secondVal)
-                pair_byId[lineId] = [mergedFirstVals, mergedSecondVals]
-
-            suffix = l  # leftovers
-            suffix['timestamp'] = timestamp  # use only the latest timestamp for duplicates
-            suffixes_byId[lineId] = suffix
-
-        # Collect back the lines for each profile
-        for lineId, sublist in pair_byId.items():
-            logLine = suffixes_byId.get(lineId)
-            mergedFirstVals  = sublist[0]
-            mergedSecondVals = sublist[1]
-            logLine[firstKey]  = mergedFirstVals
-            logLine[secondKey] = mergedSecondVals
-            newLogLines_forProfile.append(logLine)
-
-        newDictOfListsOfLines_byProfile[profile] = newLogLines_forProfile
-
-    return newDictOfListsOfLines_byProfile
+    return mergeLinesBySpec(lines, ({'unioned': (firstKey, secondKey)},))
 
 
 def mergeCommMasks(lines):
-    """Copy of mergeDictsByKeyPair() for merging comms and thier masks"""
-    newDictOfListsOfLines_byProfile = {}
-    for profile in lines:
-        newLogLines_forProfile = []
-        pair_byId = {}
-        suffixes_byId = {}
-        commMasks_byId = {}
-        for l in lines[profile]:
-            maskKey = 'mask'
-            operKey = 'operation'
-            commKey = 'comm'
-            if not l.get(maskKey) or \
-               not l.get(operKey) or \
-               not l.get(commKey):
-                newLogLines_forProfile.append(l)  # save non-mergable
-                continue
-
-            if 'file_inherit' in l.get('operation'):
-                newLogLines_forProfile.append(l)
-                continue
-
-            firstVal  = l.pop(maskKey)
-            secondVal = l.pop(operKey)
-            thirdVal  = l.pop(commKey)
-            if not isinstance(firstVal,  set) or \
-               not isinstance(secondVal, set) or \
-               not isinstance(thirdVal,  set):
-                raise NotImplementedError('Could merge diff sets only')
-
-            timestamp = l.pop('timestamp')
-            lineId = makeHashable(l)
-            if isTransitionComm(thirdVal):
-                commMasks_byId[lineId] = firstVal
-
-            if not lineId in pair_byId:
-                pair_byId[lineId] = [firstVal, secondVal, thirdVal]
-
-            else:
-                sublist = pair_byId.get(lineId)
-                mergedFirstVals  = sublist[0]
-                mergedSecondVals = sublist[1]
-                mergedThirdVals  = sublist[2]
-                mergedFirstVals.update(firstVal)
-                mergedSecondVals.update(secondVal)
-                mergedThirdVals.update(thirdVal)
-                pair_byId[lineId] = [mergedFirstVals, mergedSecondVals, mergedThirdVals]
-
-            suffix = l  # leftovers
-            suffix['timestamp'] = timestamp  # use only the latest timestamp for duplicates
-            suffixes_byId[lineId] = suffix
-
-        # Handle skipped
-        for l in newLogLines_forProfile:
-            if l.get('comm'):
-                if isTransitionComm(l.get('comm')) and len(l.get('comm')) == 1:
-                    l['transition_mask'] = l.get('mask')
-
-        # Collect back the lines for each profile
-        for lineId,sublist in pair_byId.items():
-            logLine = suffixes_byId.get(lineId)
-            mergedFirstVals  = sublist[0]
-            mergedSecondVals = sublist[1]
-            mergedThirdVals  = sublist[2]
-            logLine[maskKey] = mergedFirstVals
-            logLine[operKey] = mergedSecondVals
-            logLine[commKey] = mergedThirdVals
-            if commMasks_byId.get(lineId):
-                logLine['transition_mask'] = commMasks_byId.get(lineId)
-
-            newLogLines_forProfile.append(logLine)
-
-        newDictOfListsOfLines_byProfile[profile] = newLogLines_forProfile
-
-    return newDictOfListsOfLines_byProfile
+    """Merging comms and thier masks; transition comms mark their masks"""
+    return mergeLinesBySpec(lines, ({'unioned': ('mask', 'operation', 'comm'), 'isMarkingTransitions': True},))
 
 
 def mergeLinkMasks(lines):
@@ -1768,27 +3042,122 @@ def mergeLinkMasks(lines):
 
 def mergeExactDuplicates(lines):
 
+    return mergeLinesBySpec(lines, ({'unioned': (), 'isSkippingInherited': False},))
+
+
+# Merge steps for each line type, in order. Merge step unions sets of its keys for lines equal in everything else,
+# non-mergable lines (lacking one of the keys, or inherited) are kept. Others are applied to each line
+# and could change only keys of merge steps
+mergeSpecs = {
+    'file':    ({'unioned': ('mask', 'operation')},
+                {'unioned': ('mask', 'operation', 'comm'), 'isMarkingTransitions': True}),
+    'dbus':    ({'unioned': ('member',)},
+                composeMember,
+                {'unioned': (), 'isSkippingInherited': False}),
+    'network': ({'unioned': ('mask', 'operation')},
+                {'unioned': ('lport',)},
+                {'unioned': ('fport',)}),
+    'unix':    ({'unioned': ('mask', 'operation')},
+                {'unioned': ('mask', 'operation', 'comm'), 'isMarkingTransitions': True}),
+    'cap':     ({'unioned': (), 'isSkippingInherited': False},),
+    'signal':  ({'unioned': ('signal',)},),
+    'ptrace':  ({'unioned': ('mask',)},),
+    'mount':   ({'unioned': (), 'isSkippingInherited': False},),
+    'pivot':   ({'unioned': (), 'isSkippingInherited': False},),
+    'unknown': ({'unioned': (), 'isSkippingInherited': False},),
+}
+
+
+def mergeLinesBySpec(lines, spec):
+    """Merge lines of each profile by steps of the spec, as if each step was a separate pass.
+    Lines are hashed once, without keys the steps change; each step groups results of the previous one.
+    Merged line is the latest one, holding sets of the first one updated by others
+    """
+    stepKeys = {'transition_mask'}  # added by merge steps
+    for step in spec:
+        if isinstance(step, dict):
+            stepKeys.update(step['unioned'])
+
+    stepKeys = sorted(stepKeys)
     newDictOfListsOfLines_byProfile = {}
     for profile in lines:
-        uniqueLines_byId = {}
-        timestamps_byId = {}
-        newLogLines_forProfile = []
+        records = []  # (line id, frozen step values, line)
         for l in lines[profile]:
-            timestamp = l.pop('timestamp')
-            lineId    = makeHashable(l)
-            uniqueLines_byId[lineId] = l
-            timestamps_byId[lineId] = timestamp  # use only the latest timestamp for duplicates
+            lineId = makeHashable({k: v for k, v in l.items() if k not in stepKeys and k != 'timestamp'})
+            records.append((lineId, freezeValues(l, stepKeys), l))
 
-        for lineId, merged in uniqueLines_byId.items():
-            logLine = uniqueLines_byId.get(lineId)
-            logLine['timestamp'] = timestamps_byId.get(lineId)
-            newLogLines_forProfile.append(logLine)
+        for step in spec:
+            if isinstance(step, dict):
+                records = mergeRecords(records, step, stepKeys)
+            else:
+                records = [(lineId, freezeValues(step(l), stepKeys), l) for lineId, frozen, l in records]
 
-        newDictOfListsOfLines_byProfile[profile] = newLogLines_forProfile
+        newDictOfListsOfLines_byProfile[profile] = [l for lineId, frozen, l in records]
 
     return newDictOfListsOfLines_byProfile
 
 
+def freezeValues(l, keys):
+    """Hashable values of given keys, Ellipsis for absent ones"""
+    return [frozenset(v) if isinstance(v, set) else v for v in (l.get(k, ...) for k in keys)]
+
+
+def mergeRecords(records, step, stepKeys):
+    """Single merge step over records; lines are the same if their ids and frozen values of other step keys are"""
+    unioned = step['unioned']
+    isSkippingInherited = step.get('isSkippingInherited', True)
+    isMarkingTransitions = step.get('isMarkingTransitions', False)
+    unionedIndexes = [stepKeys.index(k) for k in unioned]
+    getIdentityValues = operator.itemgetter(*(i for i, k in enumerate(stepKeys) if k not in unioned))
+    transitionIndex = stepKeys.index('transition_mask')
+
+    nonMergable = []
+    groups = {}  # identity -> [merged sets of the first line, latest line, latest transition mask, frozen values]
+    for lineId, frozen, l in records:
+        if isSkippingInherited and (not all(l.get(k) for k in unioned) or 'file_inherit' in l.get('operation')):
+            nonMergable.append((lineId, frozen, l))  # save non-mergable
+            continue
+
+        values = [l[k] for k in unioned]
+        if not all(isinstance(v, set) for v in values):
+            raise NotImplementedError('Could merge diff sets only')
+
+        identity = (lineId, getIdentityValues(frozen))
+        group = groups.get(identity)
+        if not group:
+            group = groups[identity] = [values, l, None, frozen]
+        else:
+            for merged, v in zip(group[0], values):
+                merged.update(v)
+
+            group[1] = l  # use only the latest timestamp for duplicates
+
+        if isMarkingTransitions and isTransitionComm(l['comm']):
+            group[2] = l['mask']
+
+    if isMarkingTransitions:
+        for lineId, frozen, l in nonMergable:
+            if l.get('comm'):
+                if isTransitionComm(l.get('comm')) and len(l.get('comm')) == 1:
+                    l['transition_mask'] = l.get('mask')
+                    frozen[transitionIndex] = freezeValues(l, ('transition_mask',))[0]
+
+    # Collect back the lines
+    newRecords = nonMergable
+    for identity, (values, l, transitionMask, frozen) in groups.items():
+        for k, i, merged in zip(unioned, unionedIndexes, values):
+            l[k] = merged
+            frozen[i] = frozenset(merged)
+
+        if transitionMask:
+            l['transition_mask'] = transitionMask
+            frozen[transitionIndex] = freezeValues(l, ('transition_mask',))[0]
+
+        newRecords.append((identity[0], frozen, l))
+
+    return newRecords
+
+
 def adaptTempPaths(lines, ruleStyle):
     """Make similar path-pairs look the same for further merging. Could normalize masks. Rewrite is welcome
     Contrary to specific file path adaption, this function is designed for any path pairs
@@ -1814,6 +3183,9 @@ def adaptTempPaths(lines, ruleStyle):
         # Determine all present tails
         diffs_byTimestamp = {}
         for l in lines[profile]:
+            if l.get('trust') == 0:  # quarantined
+                continue
+
             fullPath = pathlib.PurePath(l.get('path'))
             findTempTailPair_Out = findTempTailPair(fullPath.name, ruleStyle)
             tempTail = findTempTailPair_Out[0]
@@ -1843,6 +3215,9 @@ def adaptTempPaths(lines, ruleStyle):
                 macroPath = l.pop('macro_path')
                 for j in lines[profile]:  # to find similar base pair
                     neighborPath = j.get('path')
+                    if j.get('trust') == 0:  # quarantined
+                        continue
+
                     if (neighborPath == basePath or \
                         neighborPath == macroPath):  # if current tail-line have base pair, or pair is already replaced
 
@@ -1932,15 +3307,6 @@ def isRequestedOperation(currentOperations, requestedOperations):
 
 def normalizeAndGroup(lines, args):
     """Split lines by type and convert specific values to sets for further merging"""
-    toAdaptPathKeys = (
-        'path',
-        'srcpath',
-        'target',
-        'interface',
-        'addr',
-        'peer_addr',
-    )  # must be done after normalization and before stacking
-
     fileDict = {}
     dbusDict = {}
     networkDict = {}
@@ -1994,7 +3360,6 @@ def normalizeAndGroup(lines, args):
                         if isBaseAbstractionTransition(l, profile):
                             continue
 
-                    [adaptFilePath(l, k, args.style) for k in toAdaptPathKeys if l.get(k)]
                     fileL.append(l)
 
             elif findLineType(l).startswith('DBUS'):
@@ -2033,7 +3398,6 @@ def normalizeAndGroup(lines, args):
                         l['mask'] = set(l.pop('requested').split())
                     else:
                         raise NotImplementedError('Not adapted to new key format')
-                    [adaptFilePath(l, k, args.style) for k in toAdaptPathKeys if l.get(k)]
                     unixL.append(l)
 
             elif findLineType(l) == 'CAPABILITY':
@@ -2057,7 +3421,6 @@ def normalizeAndGroup(lines, args):
                     if l.get('srcname'):
                         l['srcpath'] = l.pop('srcname')
 
-                    [adaptFilePath(l, k, args.style) for k in toAdaptPathKeys if l.get(k)]
                     mountL.append(l)
 
             elif findLineType(l) == 'PIVOT':
@@ -2067,7 +3430,6 @@ def normalizeAndGroup(lines, args):
                     if l.get('srcname'):
                         l['srcpath'] = l.pop('srcname')
 
-                    [adaptFilePath(l, k, args.style) for k in toAdaptPathKeys if l.get(k)]
                     pivotL.append(l)
 
             else:
@@ -2084,7 +3446,7 @@ def normalizeAndGroup(lines, args):
         if pivotL:   pivotDict[profile]   = pivotL
         if unknownL: unknownDict[profile] = unknownL
 
-    return (
+    groupedLines = (
         fileDict,
         dbusDict,
         networkDict,
@@ -2096,6 +3458,69 @@ def normalizeAndGroup(lines, args):
         pivotDict,
         unknownDict,
     )
+    if args.style != 'both':  # otherwise adapted for each style once forked
+        adaptFilePathsInBatch(findPathKeyPairs(groupedLines), args.style, engine=args.adapt_engine)
+
+    return groupedLines
+
+
+def findPathKeyPairs(groupedLines):
+    """(line, key) pairs of path values to adapt in lines grouped by type.
+    Must be done after normalization and before stacking
+    """
+    toAdaptPathKeys = (
+        'path',
+        'srcpath',
+        'target',
+        'interface',
+        'addr',
+        'peer_addr',
+    )
+    fileDict, dbusDict, networkDict, unixDict, capDict, signalDict, ptraceDict, mountDict, pivotDict, unknownDict = groupedLines
+
+    return [(l, k) for linesDict in (fileDict, unixDict, mountDict, pivotDict)
+                   for lines in linesDict.values()
+                   for l in lines
+                   for k in toAdaptPathKeys if l.get(k)]
+
+
+def forkStyles(groupedLines, ruleStyles, args):
+    """Copies of normalized lines for each style, with path values matched once for all of them.
+    Returns {style: lines grouped by type}; bus names normalized in default style are converted
+    """
+    forks = {ruleStyle: copy.deepcopy(groupedLines) for ruleStyle in ruleStyles[:-1]}
+    forks[ruleStyles[-1]] = groupedLines
+
+    toAdapt = {}  # is unix line -> {value: None}, ordered
+    for l, key in findPathKeyPairs(groupedLines):
+        isUnixLine = findLineType(l) == 'UNIX'
+        if l.get('trust') == 0 or \
+           all((l[key], ruleStyle, isUnixLine) in adaptionCache['entries'] for ruleStyle in ruleStyles):
+            continue
+
+        toAdapt.setdefault(isUnixLine, {})[l[key]] = None
+
+    joint = {}  # (value, is unix line) -> {style: adaption}
+    for isUnixLine, values in toAdapt.items():
+        indexJointFilePathRules(ruleStyles, isUnixLine)  # outside of line budgets
+        if valueJobs['pool']:
+            adaptions_byValue = mapValuesOnJobs(mapValuesInChunk, list(values), adaptPathValueForStyles, ruleStyles, isUnixLine)
+        else:
+            adaptions_byValue = mapValuesInChunk(values, adaptPathValueForStyles, ruleStyles, isUnixLine)
+
+        for value, adaptions in adaptions_byValue.items():  # others are adapted for each style, each on its line budget
+            adaptionCache['misses'] += len(ruleStyles)
+            joint[(value, isUnixLine)] = adaptions
+
+    for ruleStyle, fork in forks.items():
+        adaptions = {k: v[ruleStyle] for k, v in joint.items()}
+        adaptFilePathsInBatch(findPathKeyPairs(fork), ruleStyle, engine=args.adapt_engine, adaptions=adaptions)
+        for lines in fork[1].values():  # DBus
+            for l in lines:
+                if l.get('name'):
+                    l['name'] = normalizeBusName(l['name'], ruleStyle)
+
+    return forks
 
  
 def isTransitionComm(comm_):
@@ -2228,42 +3653,231 @@ def composeRule(l, args):
         rule = f"ptrace {masks} peer={l.pop('peer')},"
         l.pop('operation')
 
-    elif 'mount' in l.get('operation'):
-        path = l.pop('path')
-        l.pop('operation')
-        if l.get('flags') and \
-           l.get('srcpath'):
-            srcpath = l.pop('srcpath')
-            rule = f'mount options=({l.pop("flags")}) {srcpath} -> {path},'
+    elif 'mount' in l.get('operation'):
+        path = l.pop('path')
+        l.pop('operation')
+        if l.get('flags') and \
+           l.get('srcpath'):
+            srcpath = l.pop('srcpath')
+            rule = f'mount options=({l.pop("flags")}) {srcpath} -> {path},'
+
+        elif l.get('flags'):
+            rule = f'mount options=({l.pop("flags")}) -> {path},'
+
+        else:
+            rule = f'mount -> {path},'
+
+    elif 'umount' in l.get('operation'):
+        path = l.pop('path')
+        l.pop('operation')
+        rule = f'umount {path},'
+
+    elif findLineType(l) == 'PIVOT':
+        path = l.pop('path')
+        l.pop('operation')
+        if l.get('srcpath'):
+            srcpath = l.pop('srcpath')
+            rule = f'pivot_root {path} -> {srcpath},'
+
+        else:
+            rule = f'pivot_root {path},'
+
+    else:
+        rule = 'UNKNOWN_RULE'
+
+    rule = highlightSpecialChars(rule)
+    l['rule'] = rule
+
+    return l  # leftovers
+
+
+def mergeGroupedLines(groupedLines, ruleStyle, args):
+    """Type specific adaption and merging of lines grouped by type.
+    Heavy types could be merged in their own processes, while others are merged in this one.
+    File paths are adapted before, so workers only take temp paths, link masks, DBus paths and merging
+    """
+    lineTypes = ('file', 'dbus', 'network', 'unix', 'cap', 'signal', 'ptrace', 'mount', 'pivot', 'unknown')
+    heavyTypes = ('file', 'dbus')
+    mergedLines_byType = dict(zip(lineTypes, groupedLines))
+    toMerge = [t for t in lineTypes if t in args.type]
+    toMergeOnJobs = []
+    if args.jobs > 1 and args.jobs_split == 'types' and not ruleProfile['isEnabled']:  # rule profiles are not collected from workers
+        toMergeOnJobs = [t for t in heavyTypes if t in toMerge and mergedLines_byType[t]]
+
+    toMergeHere = [t for t in toMerge if t not in toMergeOnJobs]
+    if not toMergeOnJobs:
+        for lineType in toMergeHere:
+            mergedLines_byType[lineType] = mergeTypeLines(lineType, mergedLines_byType[lineType], ruleStyle, args)
+
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(args.jobs, len(toMergeOnJobs)),
+            mp_context=multiprocessing.get_context('fork'),  # inherits compiled rules; forked for each style
+            initializer=setLineBudget,  # signal handlers are per process
+            initargs=(args.line_budget,),
+        ) as pool:
+            futures = {pool.submit(mergeTypeLinesOnJob, t, mergedLines_byType[t], ruleStyle, args): t for t in toMergeOnJobs}
+            for lineType in toMergeHere:
+                mergedLines_byType[lineType] = mergeTypeLines(lineType, mergedLines_byType[lineType], ruleStyle, args)
+
+            for future in concurrent.futures.as_completed(futures):
+                mergedLines_byType[futures[future]], quarantinedCount = future.result()
+                lineBudget['quarantined'] += quarantinedCount
+
+    mergedLines = tuple(mergedLines_byType[t] for t in lineTypes)
+
+    return mergedLines
+
+
+def mergeTypeLines(lineType, lines, ruleStyle, args):
+    """Adaption and merging of lines of a single type"""
+    if   lineType == 'file':
+        lines = adaptTempPaths(lines, ruleStyle)
+        lines = mergeLinkMasks(lines)
+
+    elif lineType == 'dbus':
+        lines = adaptDbusPaths(lines, ruleStyle)
+
+    return mergeLinesBySpec(lines, mergeSpecs[lineType])
+
+
+def mergeTypeLinesOnJob(lineType, lines, ruleStyle, args):
+    """Worker side of mergeGroupedLines(). Returns merged lines with quarantined line count"""
+    lineBudget['quarantined'] = 0
+    mergedLines = mergeTypeLines(lineType, lines, ruleStyle, args)
+
+    return (mergedLines, lineBudget['quarantined'])
+
+
+def mergeProfiles(allLines, args):
+    """Normalized, adapted and merged lines grouped by type, for each requested style"""
+    groupedLines = normalizeAndGroup(allLines, args)
+    if args.style == 'both':
+        groupedLines_byStyle = forkStyles(groupedLines, ('default', 'AppArmor.d'), args)
+    else:
+        groupedLines_byStyle = {args.style: groupedLines}
+
+    mergedLines_byStyle = {}
+    for ruleStyle, groupedLines in groupedLines_byStyle.items():
+        mergedLines_byStyle[ruleStyle] = mergeGroupedLines(groupedLines, ruleStyle, args)
+
+    return mergedLines_byStyle
+
+
+def mergeProfilesOnJobs(allLines, args):
+    """mergeProfiles() with profiles sharded across worker processes, balanced by line count"""
+    shards = shardProfiles(allLines, args.jobs if args.jobs_split == 'profiles' else 1)
+    if len(shards) <= 1 or ruleProfile['isEnabled']:  # rule profiles are not collected from workers
+        return mergeProfiles(allLines, args)
+
+    ruleStyles = ('default', 'AppArmor.d') if args.style == 'both' else (args.style,)
+    for isUnixLine in (False, True):  # built once, before forking
+        for ruleStyle in ruleStyles:
+            if args.adapt_engine == 'generated':
+                generateFilePathAdapter(ruleStyle, isUnixLine)
+            else:
+                indexFilePathRules(ruleStyle, isUnixLine)
+
+        if len(ruleStyles) > 1:
+            indexJointFilePathRules(ruleStyles, isUnixLine)
+
+    mergedLines_byStyle = {}
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=len(shards),
+        mp_context=multiprocessing.get_context('fork'),  # inherits compiled rules and cached adaptions
+        initializer=setLineBudget,  # signal handlers are per process
+        initargs=(args.line_budget,),
+    ) as pool:
+        for shardLines_byStyle, newAdaptions, quarantinedCount in pool.map(mergeShard, shards, itertools.repeat(args)):
+            for cacheKey, adaption in newAdaptions.items():
+                adaptionCache['entries'][cacheKey] = adaption
+                adaptionCache['entries'].move_to_end(cacheKey)
+
+            lineBudget['quarantined'] += quarantinedCount
+            for ruleStyle, shardLines in shardLines_byStyle.items():
+                mergedLines = mergedLines_byStyle.setdefault(ruleStyle, tuple({} for i in range(10)))
+                for linesDict, shardLinesDict in zip(mergedLines, shardLines):
+                    linesDict.update(shardLinesDict)
+
+    entries = adaptionCache['entries']
+    while len(entries) > adaptionCache['maxsize']:
+        entries.popitem(last=False)
+
+    for ruleStyle, mergedLines in mergedLines_byStyle.items():  # same order as merged in one process
+        mergedLines_byStyle[ruleStyle] = tuple({p: linesDict[p] for p in sorted(linesDict)} for linesDict in mergedLines)
+
+    return mergedLines_byStyle
+
+
+def shardProfiles(allLines, shardCount):
+    """Split profiles into at most given number of shards with similar line counts, largest profiles first"""
+    shards = [{} for i in range(max(shardCount, 1))]
+    lineCounts = [0] * len(shards)
+    for profile in sorted(allLines, key=lambda p: len(allLines[p]), reverse=True):
+        i = lineCounts.index(min(lineCounts))
+        shards[i][profile] = allLines[profile]
+        lineCounts[i] += len(allLines[profile])
+
+    return [shard for shard in shards if shard]
+
+
+def mergeShard(allLines, args):
+    """Worker side of mergeProfilesOnJobs(). Returns merged lines with new adaptions and quarantined line count"""
+    cachedKeys = set(adaptionCache['entries'])
+    lineBudget['quarantined'] = 0
+    mergedLines_byStyle = mergeProfiles(allLines, args)
+    newAdaptions = {k: v for k, v in adaptionCache['entries'].items() if k not in cachedKeys}
+
+    return (mergedLines_byStyle, newAdaptions, lineBudget['quarantined'])
+
 
-        elif l.get('flags'):
-            rule = f'mount options=({l.pop("flags")}) -> {path},'
+def findLogLineId(l):
+    """Identity under which findLogLines() keeps only the most recent duplicate. Expected before normalization"""
+    return makeHashable({k: v for k, v in l.items() if k != 'timestamp' and not (k == 'trust' and v >= 4)})
 
-        else:
-            rule = f'mount -> {path},'
 
-    elif 'umount' in l.get('operation'):
-        path = l.pop('path')
-        l.pop('operation')
-        rule = f'umount {path},'
+def foldLogLines(lines_byProfile, keyedLines):
+    """Fold (id, line) pairs into previously found lines grouped by profile, the way findLogLines()
+    would have deduplicated them in a single run. Returns changed profiles
+    """
+    changedProfiles = set()
+    for lineId, l in keyedLines:
+        profile = l.pop('profile')  # key became profile at this point
+        profileLines = lines_byProfile.setdefault(profile, {})
+        previousLine = profileLines.pop(lineId, None)  # always use most recent line
+        if previousLine and previousLine['trust'] > l['trust']:
+            l['trust'] = previousLine['trust']
 
-    elif findLineType(l) == 'PIVOT':
-        path = l.pop('path')
-        l.pop('operation')
-        if l.get('srcpath'):
-            srcpath = l.pop('srcpath')
-            rule = f'pivot_root {path} -> {srcpath},'
+        profileLines[lineId] = l
+        changedProfiles.add(profile)
 
-        else:
-            rule = f'pivot_root {path},'
+    return changedProfiles
 
-    else:
-        rule = 'UNKNOWN_RULE'
 
-    rule = highlightSpecialChars(rule)
-    l['rule'] = rule
+def mergeIncrementally(state, keyedLines, args):
+    """Fold new lines into the persisted state, then merge again only the profiles they changed.
+    Returns merged lines for each style, as mergeProfiles() would for all lines
+    """
+    changedProfiles = foldLogLines(state['lines'], keyedLines)
+    allLines = {p: copy.deepcopy(list(state['lines'][p].values())) for p in sorted(changedProfiles)}
+    for ruleStyle, mergedLines in mergeProfilesOnJobs(allLines, args).items():
+        mergedLines_byProfile = state['merged'].setdefault(ruleStyle, {})
+        for profile in changedProfiles:
+            mergedLines_byProfile[profile] = [linesDict.get(profile) for linesDict in mergedLines]
 
-    return l  # leftovers
+    mergedLines_byStyle = {}
+    for ruleStyle, mergedLines_byProfile in state['merged'].items():
+        mergedLines = tuple({} for i in range(10))
+        for profile in sorted(mergedLines_byProfile):
+            for linesDict, lines in zip(mergedLines, mergedLines_byProfile[profile]):
+                if lines:
+                    linesDict[profile] = lines
+                    if profile not in changedProfiles:  # quarantined on previous runs
+                        lineBudget['quarantined'] += sum(l.get('trust') == 0 for l in lines)
+
+        mergedLines_byStyle[ruleStyle] = mergedLines
+
+    return mergedLines_byStyle
 
 
 def sortLines(
@@ -2346,37 +3960,19 @@ def colorizeLines(plainLines):
             l['peer'] = colorize('@{profile_name}', 'Green')
 
     # Final colorization after alignment
-    toColorizeKeys = ('path_diffs', 'target_diffs', 'addr_diffs', 'peer_addr_diffs')
-    for l in plainLines:
-        for k in toColorizeKeys:
-            if l.get(k):
-                diffs = l.get(k)
-                sortedDiffs = sorted(diffs, key=lambda t: t[0], reverse=True) # colorize from the end
-                for span, diff in sortedDiffs:
-                    originalPathKey = k.removesuffix('_diffs')
-                    if diff == '':  # colorize differently and remove from display
-                        color = 'White'
-                        diffs.remove([span, diff])
-                    else:
-                        color = 'Green'
-
-                    l[originalPathKey] = colorizeBySpan(l.get(originalPathKey), color, span)
-
-                l[k] = sorted(diffs, key=lambda t: t[0])  # prepare for display
-
-    toHighlightWordsKeys = (
-        'path',
-        'srcpath',
-        'target',
-        'interface',
-        'addr',
-        'peer_addr',
+    compileHighlightPatterns()  # outside of line budgets
+    highlightSpans = {}
+    if valueJobs['pool']:
+        values = {l[k]: None for l in plainLines if l.get('trust') != 0 for k in highlightedKeys if l.get(k)}
+        highlightSpans = mapValuesOnJobs(mapValuesInChunk, list(values), findHighlightSpans)
 
-    )
     for l in plainLines:
-        for k in toHighlightWordsKeys:
-            if l.get(k):
-                l[k] = highlightWords(l[k])
+        if l.get('trust') == 0:  # quarantined
+            continue
+
+        raw = snapshotLine(l) if lineBudget['seconds'] else None
+        if not runOnLineBudget(highlightLineValues, l, highlightSpans)[0]:
+            quarantineLine(l, raw)
 
     for l in plainLines:
         profile = l.get('profile')
@@ -2436,6 +4032,45 @@ def colorizeLines(plainLines):
     return plainLines
 
 
+highlightedKeys = (
+    'path',
+    'srcpath',
+    'target',
+    'interface',
+    'addr',
+    'peer_addr',
+)
+
+
+def highlightLineValues(l, highlightSpans=None):
+    """Spans of diffs, then of highlighted words are collected on plain values and rendered at once.
+    Spans of words could be found beforehand, as {value: spans}
+    """
+    toColorizeKeys = ('path_diffs', 'target_diffs', 'addr_diffs', 'peer_addr_diffs')
+    for k in highlightedKeys:
+        if l.get(k):
+            coloredSpans = []
+            diffsKey = f'{k}_diffs'
+            if diffsKey in toColorizeKeys and l.get(diffsKey):
+                diffs = l.get(diffsKey)
+                for span, diff in sorted(diffs, key=lambda t: t[0]):
+                    if diff == '':  # colorize differently and remove from display
+                        coloredSpans.append((span, 'White'))
+                        diffs.remove([span, diff])
+                    else:
+                        coloredSpans.append((span, 'Green'))
+
+                l[diffsKey] = sorted(diffs, key=lambda t: t[0])  # prepare for display
+
+            wordSpans = highlightSpans.get(l[k]) if highlightSpans else None
+            if wordSpans is None:
+                wordSpans = findHighlightSpans(l[k])
+
+            l[k] = colorizeBySpans(l[k], coloredSpans + wordSpans)
+
+    return l
+
+
 def adjustPadding(str_, targetPadding_):
     """By decolorizing (a copy). Temp?"""
 
@@ -2650,6 +4285,245 @@ def rewriteLatestTimestamp(pathStr, timestamp):
     return (errors, isSuccessfullWrite)
 
 
+def replacePrivateFile(path, text):
+    """Write text to a root-only file through a temporary one, never leaving it partially written"""
+    tempPath = path.with_name(f'{path.name}.tmp')
+    with open(tempPath, 'w', opener=lambda p, flags: os.open(p, flags, 0o600)) as f:
+        os.fchmod(f.fileno(), 0o600)  # leftover of an interrupted rewrite keeps its mode
+        f.write(text)
+
+    os.replace(tempPath, path)
+
+    return path
+
+
+def findAdaptionCacheVersion():
+    """Changes with any rule or tool version, invalidating persisted adaptions"""
+    digest = hashlib.sha256(__version__.encode())
+    for ruleStyle in ('default', 'AppArmor.d'):
+        for isUnixLine in (False, True):
+            for regexp, macro, prefix in compileFilePathRules(ruleStyle, isUnixLine):
+                digest.update(repr((regexp.pattern, macro, prefix)).encode())
+
+    return digest.hexdigest()
+
+
+def loadAdaptionCache(pathStr):
+    """Read previously persisted adaptions into the in-memory cache"""
+    path = pathlib.Path(pathStr)
+    dirPath = path.parent
+    errors = {}
+    loadedCount = 0
+    try:
+        if path.exists():
+            if dirPath.stat().st_uid != 0 or oct(dirPath.stat().st_mode) != '0o40700' or \
+                  path.stat().st_uid != 0 or path.stat().st_mode & 0o022:  # group or world writable
+
+                poisoning = colorize('poisoning', 'Magenta')
+                errors[
+                    f"Potential adaption cache {poisoning}! Explore '{dirPath}/' permissions."
+                ] = 21  # exit code
+
+            else:
+                cache = json.loads(path.read_text())
+                if cache.get('version') == findAdaptionCacheVersion():
+                    entries = adaptionCache['entries']
+                    for p, ruleStyle, isUnixLine, resultPath, diffs, prefix in cache['entries']:
+                        diffs = tuple((tuple(span), d) for span, d in diffs)
+                        entries[(p, ruleStyle, isUnixLine)] = (resultPath, diffs, prefix)
+                        loadedCount += 1
+
+                    while len(entries) > adaptionCache['maxsize']:
+                        entries.popitem(last=False)
+
+    except PermissionError as e:
+        poisoning = colorize('poisoning', 'Magenta')
+        errors[
+            f"Potential adaption cache {poisoning}! Explore '{dirPath}/' permissions."
+        ] = 21  # exit code
+
+    except:  # never fail; stale or malformed cache will be rewritten
+        pass
+
+    return (errors, loadedCount)
+
+
+def rewriteAdaptionCache(pathStr):
+    """(Re)write in-memory adaptions to a file for the next run"""
+    path = pathlib.Path(pathStr)
+    dirPath = path.parent
+
+    errors = {}
+    if dirPath.exists():
+        if dirPath.stat().st_uid != 0 or oct(dirPath.stat().st_mode) != '0o40700':
+            poisoning = colorize('poisoning', 'Magenta')
+            errors[
+                f"Potential adaption cache {poisoning}! Explore '{dirPath}/' permissions."
+            ] = 20  # exit code
+
+            return (errors, False)
+
+    else:
+        dirPath.mkdir(mode=0o700)
+
+    cache = {
+        'version': findAdaptionCacheVersion(),
+        'entries': [[*k, *v] for k, v in adaptionCache['entries'].items()],
+    }
+    isSuccessfullWrite = False
+    try:
+        replacePrivateFile(path, json.dumps(cache))
+        isSuccessfullWrite = True
+
+    except PermissionError as e:
+        poisoning = colorize('poisoning', 'Magenta')
+        errors[
+            f"Potential adaption cache {poisoning}! Explore '{dirPath}/' permissions."
+        ] = 20  # exit code
+
+    except:  # never fail
+        pass
+
+    return (errors, isSuccessfullWrite)
+
+
+def findIncrementalStateVersion(args):
+    """Changes with anything affecting merged lines, invalidating persisted state.
+    None if the boot is unknown, then there is no state to reuse or persist
+    """
+    displayOnlyArgs = ('hide_keys', 'sort', 'operation', 'adapt_engine', 'profile_rules', 'incremental', 'jobs', 'jobs_split')
+    try:
+        bootId = pathlib.Path('/proc/sys/kernel/random/boot_id').read_text().strip()
+    except:  # never fail
+        bootId = None
+
+    if bootId:
+        digest = hashlib.sha256(findAdaptionCacheVersion().encode())
+        digest.update(repr(bootId).encode())
+        digest.update(repr(sorted((k, v) for k, v in vars(args).items() if k not in displayOnlyArgs)).encode())
+        result = digest.hexdigest()
+    else:
+        result = None
+
+    return result
+
+
+def encodeStateValue(v):
+    """JSON compatible form of a value, preserving sets and tuples"""
+    if   isinstance(v, dict):
+        result = {k: encodeStateValue(i) for k, i in v.items()}
+
+    elif isinstance(v, list):
+        result = [encodeStateValue(i) for i in v]
+
+    elif isinstance(v, (set, tuple)):
+        result = {f'__{type(v).__name__}__': [encodeStateValue(i) for i in v]}
+
+    else:
+        result = v
+
+    return result
+
+
+def decodeStateValue(d):
+    """json.loads() hook reverting encodeStateValue()"""
+    if   '__set__' in d:
+        result = set(d['__set__'])
+
+    elif '__tuple__' in d:
+        result = tuple(d['__tuple__'])
+
+    else:
+        result = d
+
+    return result
+
+
+def makeIncrementalState(version):
+
+    state = {
+        'version':          version,
+        'cursor':           None,  # last read journal entry
+        'latest_timestamp': 0,
+        'lines':            {},    # profile -> {line id: line}, as found
+        'merged':           {},    # style -> profile -> lines for each type, as merged
+    }
+
+    return state
+
+
+def loadIncrementalState(pathStr, version):
+    """Read previously persisted journal position with lines found and merged up to it.
+    Returns empty state if there is none for this boot and arguments
+    """
+    path = pathlib.Path(pathStr)
+    dirPath = path.parent
+    errors = {}
+    state = makeIncrementalState(version)
+    try:
+        if path.exists():
+            if dirPath.stat().st_uid != 0 or oct(dirPath.stat().st_mode) != '0o40700' or \
+                  path.stat().st_uid != 0 or path.stat().st_mode & 0o022:  # group or world writable
+
+                poisoning = colorize('poisoning', 'Magenta')
+                errors[
+                    f"Potential incremental state {poisoning}! Explore '{dirPath}/' permissions."
+                ] = 21  # exit code
+
+            else:
+                previousState = json.loads(path.read_text(), object_hook=decodeStateValue)
+                if previousState.get('version') == version:
+                    state = previousState
+
+    except PermissionError as e:
+        poisoning = colorize('poisoning', 'Magenta')
+        errors[
+            f"Potential incremental state {poisoning}! Explore '{dirPath}/' permissions."
+        ] = 21  # exit code
+
+    except:  # never fail; stale or malformed state will be rewritten
+        pass
+
+    return (errors, state)
+
+
+def rewriteIncrementalState(pathStr, state):
+    """(Re)write journal position with found and merged lines for the next run.
+    Expected before merged lines are sorted and displayed
+    """
+    path = pathlib.Path(pathStr)
+    dirPath = path.parent
+
+    errors = {}
+    if dirPath.exists():
+        if dirPath.stat().st_uid != 0 or oct(dirPath.stat().st_mode) != '0o40700':
+            poisoning = colorize('poisoning', 'Magenta')
+            errors[
+                f"Potential incremental state {poisoning}! Explore '{dirPath}/' permissions."
+            ] = 20  # exit code
+
+            return (errors, False)
+
+    else:
+        dirPath.mkdir(mode=0o700)
+
+    isSuccessfullWrite = False
+    try:
+        replacePrivateFile(path, json.dumps(encodeStateValue(state)))
+        isSuccessfullWrite = True
+
+    except PermissionError as e:
+        poisoning = colorize('poisoning', 'Magenta')
+        errors[
+            f"Potential incremental state {poisoning}! Explore '{dirPath}/' permissions."
+        ] = 20  # exit code
+
+    except:  # never fail
+        pass
+
+    return (errors, isSuccessfullWrite)
+
+
 def displayLegend():
 
     itl = '\x1b[3m'
@@ -2673,6 +4547,8 @@ def displayLegend():
     bracketR_RedBg  = colorize(']', 'Red', 7)
     bracketL_MgnBg  = colorize('[', 'Magenta', 7)
     bracketR_MgnBg  = colorize(']', 'Magenta', 7)
+    bracketL_bMgnBg = colorize('[', 'Bright Magenta', 7)
+    bracketR_bMgnBg = colorize(']', 'Bright Magenta', 7)
     key_Red         = colorize('key', 'Red')
     tail_Ylw        = colorize('aBcXy9', 'Yellow')
     quote_Cya       = colorize('"', 'Cyan')
@@ -2731,6 +4607,7 @@ def displayLegend():
  {bracketL_YlwBg}{rule}{bracketR_YlwBg}                              Unknown trust
  {bracketL_RedBg}{rule}{bracketR_RedBg}                              Came from 'USER_AVC', but not a DBus line. Or came from 'AVC', but not from 'system' bus (potential journal poisoning)
  {bracketL_MgnBg}{rule}{bracketR_MgnBg}                              Came from DBus, but not a DBus line (potential journal poisoning)
+ {bracketL_bMgnBg}{rule}{bracketR_bMgnBg}                              Exceeded processing budget, shown raw (potential journal poisoning)
 
  [{rule},  {comments}]                               Comments
  [flags=({attachD_bYlw})] operation={fileI_bYlw}   Not necessarily required
@@ -2746,6 +4623,22 @@ Note: you might want to change your palette to more distinctive colors"""
     return None
 
 
+def displayExplanation(path_, ruleStyle):
+    """Print rules transforming the path"""
+    print(path_)
+    steps = explainPath(path_, ruleStyle)
+    for table, pattern, old, new, result in steps:
+        if pattern is None:
+            print(f'  {table:<5} decoded and escaped  {result}')
+        else:
+            print(f"  {table:<5} {pattern}  '{old}' -> {colorize(new, 'Green')}  {result}")
+
+    if not steps:
+        print('  no rules apply')
+
+    return None
+
+
 def handleArgs():
 
     allLineTypes = [
@@ -2772,7 +4665,7 @@ def handleArgs():
 
     parser = argparse.ArgumentParser(description='Suggest AppArmor rules')
     parser.add_argument(
-        '-v', '--version', action='version', version='aa_suggest.py 0.8.15'
+        '-v', '--version', action='version', version=f'aa_suggest.py {__version__}'
     )
     parser.add_argument(
         '--legend', action='store_true', default=False, help='Display color legend'
@@ -2861,9 +4754,57 @@ def handleArgs():
         '-S',
         '--style',
         action='store',
-        choices=['default', 'AppArmor.d'],
+        choices=['default', 'AppArmor.d', 'both'],
         default='default',
-        help="Style preset. Stock or 'roddhjav/apparmor.d'. Affects custom tunables",
+        help="Style preset. Stock or 'roddhjav/apparmor.d'. Affects custom tunables. 'both' shows each from a single pass",
+    )
+    parser.add_argument(
+        '--adapt-engine',
+        action='store',
+        choices=['interpreted', 'generated'],
+        default='interpreted',
+        help="Apply path rules to single values by interpreting tables or with generated specialized code. Batches, also on value jobs, always interpret tables. Same results",
+    )
+    parser.add_argument(
+        '--profile-rules',
+        action='store_true',
+        default=False,
+        help='Report hits, misses and time of each rule, most time consuming first',
+    )
+    parser.add_argument(
+        '--explain',
+        action='append',
+        metavar='PATH',
+        help='Show which rules transform specified path, then exit',
+    )
+    parser.add_argument(
+        '--line-budget',
+        action='store',
+        type=float,
+        metavar='SECONDS',
+        default=1.0,
+        help='CPU time a single line may take to adapt and highlight. Exceeding lines are shown raw. 0 to disable',
+    )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        action='store',
+        type=int,
+        default=1,
+        help='Normalize, adapt and merge profiles in specified number of processes',
+    )
+    parser.add_argument(
+        '--jobs-split',
+        action='store',
+        choices=['profiles', 'values', 'types'],
+        default='profiles',
+        help="Split work of '--jobs' by whole profiles, by distinct values to adapt and highlight, or by rule types. Values scale with a single dominating profile; types merge already adapted file and DBus lines in their own processes, forked for each style, copying these lines there and back",
+    )
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        default=False,
+        help='Keep found and merged lines for the next run, which then reads and merges only new journal entries',
     )
 
     args = parser.parse_args()
@@ -2872,6 +4813,12 @@ def handleArgs():
         displayLegend()
         sys.exit(0)
 
+    if args.explain:
+        for path in args.explain:
+            for ruleStyle in (('default', 'AppArmor.d') if args.style == 'both' else (args.style,)):
+                displayExplanation(path, ruleStyle)
+        sys.exit(0)
+
     if not args.type:
         args.type = allLineTypes
 
@@ -2910,95 +4857,83 @@ $ sudo apt install python3-systemd  {_Debian}
     errors.update(findPreviousTimestamp_Out[0])
     previousTimestamp = findPreviousTimestamp_Out[1]
 
-    rawLines = grabJournal(args)
-    findLogLines_Out = findLogLines(rawLines, args)
-    logLines        = findLogLines_Out[0]
-    latestTimestamp = findLogLines_Out[1]  # regardless of filtering
-    rewriteLatestTimestamp_Out = rewriteLatestTimestamp(
-        timestampPath, latestTimestamp
-    )  # write as soon as possible
-    errors.update(rewriteLatestTimestamp_Out[0])
-    unsortedLines = []
-    for l in logLines:
-        normalizeProfileName(l)
-        if findLineType(l) == 'FILE':
-            adaptProfileAutoTransitions(l)
-
-        unsortedLines.append(l)
-
-    allLines = groupLinesByProfile(unsortedLines)
-
-    groupedLines_Out = normalizeAndGroup(allLines, args)
-    (
-        fileLines,
-        dbusLines,
-        networkLines,
-        unixLines,
-        capLines,
-        signalLines,
-        ptraceLines,
-        mountLines,
-        pivotLines,
-        unknownLines,
-    ) = groupedLines_Out
-
-    if 'file'    in args.type:
-        fileLines = adaptTempPaths(fileLines, args.style)
-        fileLines = mergeLinkMasks(fileLines)
-        fileLines = mergeDictsByKeyPair(fileLines, 'mask', 'operation')
-        fileLines = mergeCommMasks(fileLines)
-
-    if 'dbus'    in args.type:
-        dbusLines = adaptDbusPaths(dbusLines, args.style)
-        dbusLines = mergeDictsBySingleKey(dbusLines, 'member')
-        dbusLines = composeMembers(dbusLines)
-        dbusLines = mergeExactDuplicates(dbusLines)
-
-    if 'network' in args.type:
-        networkLines = mergeDictsByKeyPair(networkLines, 'mask', 'operation')
-        networkLines = mergeDictsBySingleKey(networkLines, 'lport')
-        networkLines = mergeDictsBySingleKey(networkLines, 'fport')
-
-    if 'unix'    in args.type:
-        unixLines    = mergeDictsByKeyPair(unixLines, 'mask', 'operation')
-        unixLines    = mergeCommMasks(unixLines)
-
-    if 'cap'     in args.type:
-        capLines     = mergeExactDuplicates(capLines)
-
-    if 'signal'  in args.type:
-        signalLines  = mergeDictsBySingleKey(signalLines, 'signal')
-
-    if 'ptrace'  in args.type:
-        ptraceLines  = mergeDictsBySingleKey(ptraceLines, 'mask')
-
-    if 'mount'   in args.type:
-        mountLines   = mergeExactDuplicates(mountLines)
-
-    if 'pivot'   in args.type:
-        pivotLines   = mergeExactDuplicates(pivotLines)
+    adaptionCachePath = '/dev/shm/apparmor_suggest/adaption.cache'
+    if args.profile_rules:
+        setRuleProfiling(True)  # cached adaptions would not reach the rules
+    else:
+        loadAdaptionCache_Out = loadAdaptionCache(adaptionCachePath)
+        errors.update(loadAdaptionCache_Out[0])
+
+    incrementalStatePath = '/dev/shm/apparmor_suggest/incremental.state'
+    stateVersion = None
+    if args.incremental and not args.profile_rules:  # persisted lines would not reach the rules
+        stateVersion = findIncrementalStateVersion(args)
+
+    if stateVersion:
+        loadIncrementalState_Out = loadIncrementalState(incrementalStatePath, stateVersion)
+        errors.update(loadIncrementalState_Out[0])
+        state = loadIncrementalState_Out[1]
+    else:
+        state = makeIncrementalState(None)
 
-    if 'unknown' in args.type:
-        unknownLines = mergeExactDuplicates(unknownLines)
-
-    sortedLines = sortLines(
-        fileLines,
-        dbusLines,
-        networkLines,
-        unixLines,
-        capLines,
-        signalLines,
-        ptraceLines,
-        mountLines,
-        pivotLines,
-        unknownLines,
-        args,
-    )
+    setLineBudget(args.line_budget)
+    if args.jobs_split == 'values' and not args.profile_rules:  # rule profiles are not collected from workers
+        setValueJobs(args.jobs)
+
+    try:
+        grabJournal_Out = grabJournal(args, state['cursor'])
+        rawLines = grabJournal_Out[0]
+        findLogLines_Out = findLogLines(rawLines, args)
+        logLines        = findLogLines_Out[0]
+        latestTimestamp = max(findLogLines_Out[1], state['latest_timestamp'])  # regardless of filtering
+        rewriteLatestTimestamp_Out = rewriteLatestTimestamp(
+            timestampPath, latestTimestamp
+        )  # write as soon as possible
+        errors.update(rewriteLatestTimestamp_Out[0])
+        unsortedLines = []
+        logLineIds = []
+        for l in logLines:
+            logLineIds.append(findLogLineId(l))
+            normalizeProfileName(l)
+            if findLineType(l) == 'FILE':
+                adaptProfileAutoTransitions(l)
+
+            unsortedLines.append(l)
+
+        if args.incremental:
+            mergedLines_byStyle = mergeIncrementally(state, zip(logLineIds, unsortedLines), args)
+            if state['version'] and state['cursor'] != grabJournal_Out[1]:  # unchanged without new entries
+                state['cursor'] = grabJournal_Out[1]
+                state['latest_timestamp'] = latestTimestamp
+                rewriteIncrementalState_Out = rewriteIncrementalState(incrementalStatePath, state)
+                errors.update(rewriteIncrementalState_Out[0])
+
+        else:
+            allLines = groupLinesByProfile(unsortedLines)
+            mergedLines_byStyle = mergeProfilesOnJobs(allLines, args)
+
+        for ruleStyle, mergedLines in mergedLines_byStyle.items():
+            sortedLines    = sortLines(*mergedLines, args)
+            padding        = findPadding(sortedLines)
+            colorizedLines = colorizeLines(sortedLines)
+
+            if len(mergedLines_byStyle) > 1:
+                print(colorize(f'\n# {ruleStyle} style', 'Bright Cyan'))
+
+            display(colorizedLines, padding, previousTimestamp, args)
+
+    finally:
+        setValueJobs(0)  # no workers left running on errors
+
+    if args.profile_rules:
+        print(composeRuleProfile())
 
-    padding        = findPadding(sortedLines)
-    colorizedLines = colorizeLines(sortedLines)
+    if lineBudget['quarantined']:
+        quarantined = colorize(f"{lineBudget['quarantined']} lines", 'Magenta')
+        errors[f'{quarantined} exceeded processing budget and are shown raw (potential journal poisoning)'] = 12
 
-    display(colorizedLines, padding, previousTimestamp, args)
+    rewriteAdaptionCache_Out = rewriteAdaptionCache(adaptionCachePath)
+    errors.update(rewriteAdaptionCache_Out[0])
 
     if not isSupportedDistro():
         not_supported = colorize('not supported', 'Yellow')
@@ -3012,7 +4947,7 @@ $ sudo apt install python3-systemd  {_Debian}
             f'Designed to be run {as_root_user}. Will not rely on timestamps. Watch out for inconsistencies.'
         ] = 8
 
-    if not rawLines:
+    if not rawLines and not state['lines']:
         taken_over = colorize('taken over', 'Yellow')
         errors[f"Empty journal! Was {taken_over} by 'auditd'?"] = 100
 
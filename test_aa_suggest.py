@@ -3,7 +3,9 @@
 # SPDX-License-Identifier: GPL-3.0-only
 
 import unittest
+import unittest.mock
 import copy
+import tempfile
 from aa_suggest import *
 
 class simpleTests(unittest.TestCase):
@@ -24,6 +26,11 @@ class simpleTests(unittest.TestCase):
         self.assertEqual(hexToString('abcdef0'),        'abcdef0')        # ??
         self.assertEqual(hexToString('ABCDEF00000000'), 'ABCDEF00000000') # ??? TODO
         self.assertNotEqual(hexToString(whitespaceHex), whitespaceHex)
+        self.assertEqual(hexToString(''),               '')
+        self.assertEqual(hexToString('@'),              '@')
+        self.assertEqual(hexToString('00000000'),       '')
+        self.assertEqual(hexToString('2F746D70 2F78'),  '2F746D70 2F78')  # whitespaces are not hex
+        self.assertEqual(hexToString('@2F746D702F78'),  '@/tmp/x')
 
     def test_findTempTailPair(self):
         self.assertEqual(findTempTailPair('file0',              'default'),             (None,         None))
@@ -254,6 +261,9 @@ class simpleTests(unittest.TestCase):
         self.assertEqual(getBaseBin(f'/{grn}{{,usr/}}{rst}bin/echo'), 'echo')
         self.assertEqual(getBaseBin(f'/{grn}{{usr/,}}{rst}bin/echo'), 'echo')
         self.assertEqual(getBaseBin(f'{grn}@{{bin}}{rst}/echo'),      'echo')
+        self.assertIsNone(getBaseBin(f'/\x1b[0;37m{{,usr/}}{rst}bin/echo'))  # empty diff
+        self.assertIsNone(getBaseBin('/{,usr/}bin/echo'))
+        self.assertIsNone(getBaseBin('@{bin}/echo'))
         self.assertIsNone(getBaseBin('/usr/sbin/echo'))
         self.assertIsNone(getBaseBin('/sbin/echo'))
         self.assertIsNone(getBaseBin('/usr/bin/dir/echo'))
@@ -277,6 +287,22 @@ class colorizationTests(unittest.TestCase):
         for i,r in postcolorizationDiffs:
             self.assertEqual(updatePostcolorizationDiffs(i[0], i[1], i[2], i[3]), r)
 
+    def test_resolvePostcolorizationDiffs(self):
+        diffsAndResults = (
+((None, ()), []),
+((None, (((10, 16), '1000'), ((0, 6), '/run'))), [[(0, 6), '/run'], [(12, 18), '1000']]),  # same as one by one
+(([[(22, 28), 'aBcXy9']], (((8, 12), ''),)), [[(8, 12), ''], [(26, 32), 'aBcXy9']]),  # present diffs are shifted
+((None, (((5, 6), ''), ((5, 6), ''), ((5, 6), ''))), [[(5, 6), ''], [(6, 7), ''], [(7, 8), '']]),  # coinciding spans, backslash run
+((None, (((3, 9), 'ab'), ((3, 9), 'cd'))), [[(3, 9), 'ab'], [(3, 9), 'cd']]),  # coinciding spans, different diffs
+        )
+        for i,r in diffsAndResults:
+            self.assertEqual(resolvePostcolorizationDiffs(*i), r)
+            diffs = i[0]
+            for span, d in i[1]:  # must not depend on resolving at once
+                diffs = updatePostcolorizationDiffs({'path_diffs': diffs}, span, d, 'path')['path_diffs']
+
+            self.assertEqual(diffs or [], r)
+
     def test_highlightWords(self):
         '''Leading "/" means regular directory, not necessarily root directory'''
         red = '\x1b[0;31m'
@@ -310,14 +336,14 @@ class colorizationTests(unittest.TestCase):
 ('/.ssh/id_ecdsa-sk',    f'/.ssh/{red}id_ecdsa-sk{rst}'),
 ('/.ssh/id_ed25519',     f'/.ssh/{red}id_ed25519{rst}'),
 ('/.ssh/id_ed25519-sk',  f'/.ssh/{red}id_ed25519-sk{rst}'),
-('/ssh_host_dsa_key',       f'/{red}ssh_host_dsa_{red}key{rst}{rst}'),
-('/ssh_host_rsa_key',       f'/{red}ssh_host_rsa_{red}key{rst}{rst}'),
-('/ssh_host_ecdsa_key',     f'/{red}ssh_host_ecdsa_{red}key{rst}{rst}'),
-('/ssh_host_ed25519_key',   f'/{red}ssh_host_ed25519_{red}key{rst}{rst}'),
+('/ssh_host_dsa_key',       f'/{red}ssh_host_dsa_key{rst}'),
+('/ssh_host_rsa_key',       f'/{red}ssh_host_rsa_key{rst}'),
+('/ssh_host_ecdsa_key',     f'/{red}ssh_host_ecdsa_key{rst}'),
+('/ssh_host_ed25519_key',   f'/{red}ssh_host_ed25519_key{rst}'),
 ('/ssh_host_rsa_key.pub',            f'/ssh_host_rsa_key.pub'),
 ('/ssh_host_rsa_cus.tom_key.pub',     '/ssh_host_rsa_cus.tom_key.pub'),
-('/ssh_host_rsa_cus.tom_key',        f'/{red}ssh_host_rsa_cus.tom_{red}key{rst}{rst}'),
-('/ssh_host_ed25519_key_custom',     f'/{red}ssh_host_ed25519_{red}key{rst}_{rst}custom'),
+('/ssh_host_rsa_cus.tom_key',        f'/{red}ssh_host_rsa_cus.tom_key{rst}'),
+('/ssh_host_ed25519_key_custom',     f'/{red}ssh_host_ed25519_key_{rst}custom'),
 ('0', f'{red}0{rst}'),
 ('/0', f'/{red}0{rst}'),
 ('/0/', f'/{red}0{rst}/'),
@@ -469,6 +495,16 @@ class colorizationTests(unittest.TestCase):
 ('/python3.10/dist-packages/dateutil/__pycache__/', f'/python3.10/dist-packages/{ylw}dateutil{rst}/__pycache__/'),
 (f'/python3.{num_}/dist-packages/dateutil/__pycache__/', f'/python3.{num_}/dist-packages/{ylw}dateutil{rst}/__pycache__/'),
 (f'/python3.{int_}/dist-packages/dateutil/__pycache__/', f'/python3.{int_}/dist-packages/{ylw}dateutil{rst}/__pycache__/'),
+# Adjacent and overlapping; patterns see neighbouring plain text, never earlier highlights
+('/etc/secretshadow', f'/etc/{red}secret{rst}{red}shadow{rst}'),  # adjacent
+('/etc/passkey',      f'/etc/{red}pass{rst}{red}key{rst}'),
+('/etc/shadowsecret', f'/etc/shadow{red}secret{rst}'),  # 'shadows' is excluded, even if 's' is highlighted
+('/procshadowsecret', f'/procshadow{red}secret{rst}'),
+('/e561af98c3584a29a4eab8a761aceaf9cred',           f'/e561af98c3584a29a4eab8a761aceaf9{red}cred{rst}'),  # hex run goes on with 'c'
+('/e561af98c3584a29a4eab8a761aceaf9cookies.sqlite', f'/e561af98c3584a29a4eab8a761aceaf9{red}cookies{rst}.sqlite'),
+('/e561af98c3584a29a4eab8a761aceaf9/cred',          f'/{ylw}e561af98c3584a29a4eab8a761aceaf9{rst}/{red}cred{rst}'),
+('/proc/1/cmdline', f'/proc/{red}1{rst}/cmdline'),  # overlapping match is dropped, not cut
+(f'/home/user/.ssh/id_rsa', f'/home/{ylw}user{rst}/.ssh/{red}id_rsa{rst}'),
         )
         for p,r in pathsAndResults:
             self.assertEqual(highlightWords(p), r)
@@ -478,6 +514,70 @@ class colorizationTests(unittest.TestCase):
         self.assertEqual(highlightWords('/secrets/123-abcxy9/', False), f'/{red}secret{rst}s/123-abcxy9/')
         self.assertEqual(highlightWords('/123.AbcdWxyz',        False), f'/123.AbcdWxyz')
 
+    def test_classifyPathSegments(self):
+        self.assertEqual(classifyPathSegments(''),                                   (0, 0, 0, 0))
+        self.assertEqual(classifyPathSegments('/usr/share/'),                        (0, 1, 5, 5))
+        self.assertEqual(classifyPathSegments('/run/user/1000/a1B2c3/x_y'),          (4, 6, 6, 6))
+        self.assertEqual(classifyPathSegments('/u/12345678-1234-1234-1234-123456789abc'), (9, 12, 12, 12))
+
+    def test_findSegmentRequirements(self):
+        self.assertEqual(findSegmentRequirements(r'/#(\d+)$'),                     ((0, 1),))
+        self.assertEqual(findSegmentRequirements(r'(?=[^0-9a-f]([0-9a-f]{32}))'),  ((1, 32),))
+        self.assertEqual(findSegmentRequirements(r'/(?:a|bc)(\w{8}|[0-9]{2})'),    ((1, 1),))
+        self.assertEqual(findSegmentRequirements(r'(?i)(key)'),                     ())
+        self.assertEqual(findSegmentRequirements(r'/([^/]+)/'),                     ())
+
+        for p in ('/tmp/aBcXy9', '/x-0327a5b9f676b500327a5b9f676b50542f', '/screen/ccdda718_5099_4509_a984_05540a913901/'):
+            runs = classifyPathSegments(p)
+            for findSpans, requirements in compileHighlightPatterns()[1]:
+                if findSpans(p):
+                    self.assertTrue(isMeetingRequirements(runs, requirements))
+
+    def test_colorizeBySpans(self):
+        red = '\x1b[0;31m'
+        grn = '\x1b[0;32m'
+        whtb = '\x1b[1;37m'
+        rst = '\x1b[0m'
+        self.assertEqual(colorizeBySpans('/a/b/c', []),                                          '/a/b/c')
+        self.assertEqual(colorizeBySpans('/a/b/c', [((5, 6), 'Red'), ((1, 2), 'Green')]),        f'/{grn}a{rst}/b/{red}c{rst}')
+        self.assertEqual(colorizeBySpans('/a/b/c', [((1, 4), 'Green'), ((3, 6), 'Red')]),        f'/{grn}a/b{rst}/c')  # overlap
+        self.assertEqual(colorizeBySpans('/a/b/c', [((1, 1), 'Green'), ((1, 2), 'White', '1')]), f'/{grn}{rst}\x1b[1;37ma{rst}/b/c')  # empty span
+
+        plain, coloredSpans = decolorizeToSpans(f'/{grn}a{rst}/b/{whtb}c{rst}')
+        self.assertEqual(plain,        '/a/b/c')
+        self.assertEqual(coloredSpans, [((1, 2), 'Green', '0'), ((5, 6), 'White', '1')])
+        self.assertEqual(colorizeBySpans(plain, coloredSpans), f'/{grn}a{rst}/b/{whtb}c{rst}')
+
+    def test_findHexRunSpans(self):
+        md5 = 'e561af98c3584a29a4eab8a761aceaf9'
+        self.assertEqual(findHexRunSpans(f'/{md5}/'),                                  [(1, 33)])
+        self.assertEqual(findHexRunSpans(md5),                                         [])  # nothing before
+        self.assertEqual(findHexRunSpans(f'/{md5}0/'),                                 [])
+        self.assertEqual(findHexRunSpans('/0x00007f2a1b3c4d5e'),                       [(3, 19)])
+        self.assertEqual(findHexRunSpans('0x00007f2a1b3c4d5e'),                        [])
+        self.assertEqual(findHexRunSpans('/a0x00007f2a1b3c4d5e'),                      [])
+        self.assertEqual(findHexRunSpans('/ccdda718_5099_4509-a984_05540a913901'),      [(1, 37)])
+        self.assertEqual(findHexRunSpans('/ccdda718_5099_4509-a984_05540a9139010'),     [])
+        self.assertEqual(findHexRunSpans('/ccdda718_5099_4509--a984_05540a913901'),     [])
+
+    def test_findRequiredLiteral(self):
+        self.assertEqual(findRequiredLiteral(r'/\.ssh/(id[^.]+)(?!.*\.pub)(?:/|$)'), '/.ssh/id')
+        self.assertEqual(findRequiredLiteral(r'(?<!non)(secret)(?!agogue|ion)'),    'secret')
+        self.assertEqual(findRequiredLiteral(r'(?:/\d+)?/(cmdline)$'),               '/cmdline')
+        self.assertEqual(findRequiredLiteral(r'(?:a|b)'),                            '')
+
+    def test_findHighlightKeywords(self):
+        sensitivePatterns, volatilePatterns, keywordRe, keywordsImplied = compileHighlightPatterns()
+        self.assertEqual(findHighlightKeywords('/x/ROOT/Secret', keywordRe, keywordsImplied), {'root', 'secret'})
+        self.assertEqual(findHighlightKeywords('/passhadow',     keywordRe, keywordsImplied), {'pass', 'shadow'})
+        self.assertEqual(findHighlightKeywords('/usr/lib',       keywordRe, keywordsImplied), set())
+        self.assertEqual(findHighlightKeywords('/prıv',          keywordRe, keywordsImplied), None)
+
+        red = '\x1b[0;31m'
+        rst = '\x1b[0m'
+        self.assertEqual(highlightWords('/prıv'),      f'/{red}prıv{rst}')  # case folded
+        self.assertEqual(highlightWords('/passhadow'), f'/{red}pass{rst}hadow')
+
 class regexTests(unittest.TestCase):
 
     def setUp(self):
@@ -621,6 +721,7 @@ class regexTests(unittest.TestCase):
     {'path': '/usr/libexec/',                           'operation': {'open'}}),
         )
         for i,r in filePaths_default:
+            self.assertEqual(applyFilePathRules(copy.deepcopy(i), 'path', 'default', findLineType(i) == 'UNIX', 'generated'), r)
             self.assertEqual(adaptFilePath(i, 'path', 'default'), r)
 
         filePaths_apparmor_d = (
@@ -751,6 +852,7 @@ class regexTests(unittest.TestCase):
     {'path': '@{lib}/d/x86_64-linux-gnu/',              'operation': {'open'}, 'path_diffs': [[(0, 6), '/usr/lib']]}),
         )
         for i,r in filePaths_apparmor_d:
+            self.assertEqual(applyFilePathRules(copy.deepcopy(i), 'path', 'AppArmor.d', findLineType(i) == 'UNIX', 'generated'), r)
             self.assertEqual(adaptFilePath(i, 'path', 'AppArmor.d'), r)
 
     def test_adaptDbusPaths(self):
@@ -818,6 +920,33 @@ class regexTests(unittest.TestCase):
         for i,r in dbusPaths_apparmor_d:
             self.assertEqual(adaptDbusPaths(i, 'AppArmor.d'), r)
 
+        # Cached value is not shared, existing diffs are shifted uncached
+        lines = {'synth': [{'path': '/Client12', 'operation': {'dbus_signal'}} for i in range(2)]}
+        adaptDbusPaths(lines, 'AppArmor.d')
+        lines['synth'][0]['path_diffs'].append('mutated')
+        self.assertEqual(lines['synth'][1]['path_diffs'], [[(7, 13), '12']])
+        self.assertEqual(adaptDbusPathValue('/Client12', 'AppArmor.d'), ('/Client@{int}', (((7, 13), '12'),)))
+
+        withDiffs = {'synth': [{'path': '@{run}/Client12', 'path_diffs': [[(0, 6), '/run']], 'operation': {'dbus_signal'}}]}
+        self.assertEqual(adaptDbusPaths(withDiffs, 'AppArmor.d')['synth'][0]['path_diffs'], [[(0, 6), '/run'], [(13, 19), '12']])
+
+    def test_escapePcreChars(self):
+        self.assertEqual(escapePcreChars('/plain'),         ('/plain',                   []))
+        self.assertEqual(escapePcreChars('/a?b'),           ('/a\\?b',                   [(2, 3)]))
+        self.assertEqual(escapePcreChars('/a\\?b*'),        ('/a\\\\?b\\*',              [(2, 3), (6, 7)]))  # already escaped
+        self.assertEqual(escapePcreChars('/x\\y\\z[1]'),    ('/x\\\\\\y\\z\\[1\\]',      [(2, 3), (3, 4), (8, 9), (11, 12)]))  # first backslash run
+
+        for p in ('/a?b', '/a\\?b*', '/x\\y\\z[1]', '/{a,b}/"c"!^'):  # same as substituting one by one
+            substituted = prepareFilePath({'path': p, 'path_diffs': [[(99, 100), 'tail']]}, 'path')
+            substituted['path_diffs'].pop()  # shifted tail
+            self.assertEqual(prepareFilePath({'path': p}, 'path'), substituted)
+
+    def test_normalizeBusName(self):
+        self.assertEqual(normalizeBusName(':1.234',               'default'),    ':1.[0-9]*')
+        self.assertEqual(normalizeBusName(':1.234',               'AppArmor.d'), ':1.@{int}')
+        self.assertEqual(normalizeBusName('org.freedesktop.DBus', 'default'),    'org.freedesktop.DBus')
+        self.assertEqual(normalizeBusName(':1.[0-9]*',            'AppArmor.d'), ':1.@{int}')  # converted
+
     def test_substituteGroup(self):
         self.assertEqual(substituteGroup('one_two_three', '2',      '_(two)_'),
                                         ('one_2_three',   (4, 5),   'two'))
@@ -831,6 +960,307 @@ class regexTests(unittest.TestCase):
         self.assertRaises(NotImplementedError, substituteGroup, 'one_two_three', '10', '(one)_(two)_')
         self.assertRaises(ValueError,          substituteGroup, 'one_two_three', 'owner', '_t.._')
 
+    def test_compileFilePathRules(self):
+        for style in ('default', 'AppArmor.d'):
+            for isUnixLine in (False, True):
+                rules = compileFilePathRules(style, isUnixLine)
+                self.assertIs(rules, compileFilePathRules(style, isUnixLine))  # built once
+                for regexp, macro, prefix in rules:
+                    self.assertEqual(regexp.groups, 1)
+                    self.assertNotIn(macro, (None, 'owner'))
+                    self.assertIn(prefix, (None, 'owner', 'deny'))
+
+        self.assertLess(len(compileFilePathRules('default', True)), len(compileFilePathRules('default', False)))  # no tunables for unix lines
+
+    def test_adaptPathValue(self):
+        adaptionCache['entries'].clear()
+        hits, misses = adaptionCache['hits'], adaptionCache['misses']
+        first  = adaptFilePath({'path': '/proc/12/maps',   'operation': {'open'}}, 'path', 'default')
+        second = adaptFilePath({'target': '/proc/12/maps', 'operation': {'open'}}, 'target', 'default')
+        self.assertEqual(adaptionCache['misses'], misses + 1)
+        self.assertEqual(adaptionCache['hits'],   hits + 1)
+        self.assertEqual(first['path'],       second['target'])
+        self.assertEqual(first['path_diffs'], second['target_diffs'])
+        self.assertIsNot(first['path_diffs'], second['target_diffs'])  # not shared between lines
+
+        # Already adapted values are not cached
+        third = adaptFilePath({'path': '/proc/12/maps', 'operation': {'open'}, 'path_prefix': 'deny'}, 'path', 'default')
+        self.assertEqual(adaptionCache['hits'], hits + 1)
+        self.assertEqual(third['path_prefix'], 'owner')
+
+    def test_adaptFilePathsInBatch(self):
+        lines = (
+            {'path': '/usr/lib/x86_64-linux-gnu/libc.so.6',  'operation': {'open'}},
+            {'path': '/proc/1234/task/5678/stat',            'operation': {'open'}},
+            {'path': '/home/user/.cache/fontconfig/a.tmp',   'operation': {'open'}, 'target': '/usr/bin/[x'},
+            {'path': '/tmp/tmp.AbCd12/x',                    'operation': {'open'}, 'path_prefix': 'deny'},
+            {'path': '/usr/lib/x86_64-linux-gnu/libc.so.6',  'operation': {'open'}},
+            {'addr': '@/home/user/.cache/ibus/dbus-aBcD1234', 'operation': {'connect'}, 'family': 'unix', 'sock_type': 'stream'},
+            {'path': '2F746D702F6C696E650A6272656B',         'operation': {'open'}},  # newline
+        )
+        for ruleStyle in ('default', 'AppArmor.d'):
+            expected = [copy.deepcopy(l) for l in lines]
+            for l in expected:
+                for k in ('path', 'target', 'addr'):
+                    if l.get(k):
+                        adaptionCache['entries'].clear()
+                        adaptFilePath(l, k, ruleStyle)
+
+            adaptionCache['entries'].clear()
+            result = [copy.deepcopy(l) for l in lines]
+            adaptFilePathsInBatch([(l, k) for l in result for k in ('path', 'target', 'addr') if l.get(k)], ruleStyle, batchThreshold=1)
+            self.assertEqual(result, expected)
+
+    def test_adaptPathValueForStyles(self):
+        ruleStyles = ('default', 'AppArmor.d')
+        paths = (
+            '/proc/12/maps',
+            '/usr/bin/python3.12',
+            '/sys/devices/pci0000:00/0000:00:02.0/drm/card1/uevent',
+            '/home/user/.cache/ibus/dbus-aBcD1234',
+            '/home/user/.local/share/gvfs-metadata/root',  # AppArmor.d only
+            '2F746D702F612062',
+            '/etc/fstab',
+        )
+        for isUnixLine in (False, True):
+            for p in paths:
+                adaptions = adaptPathValueForStyles('@' + p if isUnixLine else p, ruleStyles, isUnixLine)
+                for ruleStyle in ruleStyles:
+                    adaptionCache['entries'].clear()
+                    self.assertEqual(adaptions[ruleStyle], adaptPathValue('@' + p if isUnixLine else p, ruleStyle, isUnixLine))
+
+        self.assertNotEqual(*adaptPathValueForStyles('/usr/bin/python3.12', ruleStyles, False).values())
+
+    def test_setRuleProfiling(self):
+        line = {'path': '/proc/12/maps', 'operation': {'open'}}
+        expected = adaptFilePath(dict(line), 'path', 'default')
+        try:
+            setRuleProfiling(True)
+            self.assertEqual(adaptFilePath(dict(line), 'path', 'default'), expected)
+            self.assertTrue(isBaseAbstractionPath('/proc/12/maps', frozenset('r')))
+            rules = ruleProfile['rules']
+            self.assertEqual(rules[('file', r'^((?:/proc))/')][:2], [1, 0])
+            self.assertGreaterEqual(rules[('base', r'^(?:/proc|@{PROC})/\d+/(maps|auxv|status)$')][0], 1)
+            report = composeRuleProfile().splitlines()
+            self.assertEqual(len(report), len(rules) + 2)
+            self.assertTrue(report[-1].endswith('never matched'))
+        finally:
+            setRuleProfiling(False)
+
+        self.assertEqual(ruleProfile['rules'], {})
+        self.assertIsInstance(compileFilePathRules('default', False)[0][0], re.Pattern)  # no overhead
+
+    def test_explainPath(self):
+        self.assertEqual(explainPath('/proc/12/maps', 'default'), [
+            ('file', r'^((?:/proc))/', '/proc', '@{PROC}', '@{PROC}/12/maps'),
+            ('file', r'^(?:/proc|@{PROC})/((?:[2-9]|[1-9][0-9]{1,8}|[1-4][0-9]{9}))/', '12', '@{pid}', '@{PROC}/@{pid}/maps'),
+        ])
+        self.assertEqual(explainPath('2F746D702F612062', 'default'), [('file', None, '2F746D702F612062', '/tmp/a b', '/tmp/a b')])
+        self.assertEqual(explainPath('/org/freedesktop/login1/session/_32', 'default')[0][::4], ('dbus', '/org/freedesktop/login1/session/*'))
+        self.assertEqual(explainPath('/etc/fstab', 'default'), [])
+
+    def test_setLineBudget(self):
+        def burn(seconds):
+            end = os.times().user + seconds  # budget is in user CPU time
+            while os.times().user < end:
+                sum(range(1000))
+
+            return seconds
+
+        slow = lambda *args: burn(1)  # bounded, fails instead of hanging if not interrupted
+
+        def swallowing():
+            try:
+                return slow()
+            except Exception:
+                return 'swallowed'
+
+        line = {'path': '2F746D702F612062', 'operation': {'open'}, 'mask': {'r'}, 'trust': 10}
+        raw = copy.deepcopy(line)
+        try:
+            setLineBudget(0.05)
+            self.assertEqual(runOnLineBudget(slow), (False, None))
+            self.assertEqual(runOnLineBudget(re.search, r'(a+)+$', 'a' * 24 + '!'), (False, None))  # about a second if not interrupted
+            self.assertEqual(runOnLineBudget(len, 'abc'), (True, 3))
+            self.assertEqual(runOnLineBudget(swallowing), (False, None))
+            self.assertEqual(runOnLineBudget(burn, 0.1), (False, None))
+            self.assertEqual(runOnLineBudget(burn, 0.1, lineCount=8), (True, 0.1))  # batch of 8 lines
+            with unittest.mock.patch('aa_suggest.adaptFilePath', slow):
+                adaptFilePathsInBatch([(line, 'path')], 'default')
+
+            self.assertEqual(line, raw | {'trust': 0})
+            self.assertEqual(lineBudget['quarantined'], 1)
+            self.assertEqual(adaptFilePathsInBatch([(line, 'path')], 'default')[0][0]['path'], raw['path'])  # skipped
+            self.assertEqual(colorizeLines([line])[0]['path'], raw['path'])  # not highlighted
+            self.assertEqual(line['trust_color'], 'Bright Magenta')
+        finally:
+            setLineBudget(0)
+
+        self.assertEqual(runOnLineBudget(len, 'abc'), (True, 3))
+
+    def test_setValueJobs(self):
+        values = ['/home/user/.cache/a/1234', '/proc/42/fd/', '/tmp/.X11-unix/X1', '/usr/share/a', '/home/user/.ssh/id_ed25519']
+        lines = [{'path': p, 'operation': {'open'}, 'mask': {'r'}, 'trust': 10} for p in values]
+        expected = colorizeLines([l for l, k in adaptFilePathsInBatch([(l, 'path') for l in copy.deepcopy(lines)], 'default')])
+        adaptionCache['entries'].clear()
+        try:
+            setValueJobs(2)
+            self.assertEqual(mapValuesOnJobs(mapValuesInChunk, list('abc'), str.upper), {'a': 'A', 'b': 'B', 'c': 'C'})
+            result = colorizeLines([l for l, k in adaptFilePathsInBatch([(l, 'path') for l in lines], 'default')])
+        finally:
+            setValueJobs(0)
+
+        self.assertEqual(result, expected)
+        self.assertIsNone(valueJobs['pool'])
+
+        def burn(*args):
+            end = os.times().user + 1
+            while os.times().user < end:
+                sum(range(1000))
+
+        adaptions = adaptPathValuesInBatch(values, 'default', False)
+        try:
+            setLineBudget(0.05)
+            with unittest.mock.patch('aa_suggest.adaptPathValuesInBatch', burn):  # exceeding chunk is redone by the engine
+                self.assertEqual(adaptValuesChunk(values, 'default', False, 'generated'), adaptions)
+        finally:
+            setLineBudget(0)
+
+    def test_findBacktrackingRisks(self):
+        reasons = lambda r: [reason for reason, items in findBacktrackingRisks(r)]
+        self.assertEqual(reasons(r'(a+)+$'),              ['nested unbounded repeats'])
+        self.assertEqual(reasons(r'\d+\w+x'),             ['adjacent overlapping unbounded repeats'])
+        self.assertEqual(reasons(r'(id[^.]+)(?!.*\.pub)'), ['unbounded lookahead after unbounded repeat'])
+        self.assertEqual(reasons(r'[^/]+-linux-(?:gnu|musl)(?:[^/]+)?'), [])  # separated by literals
+        self.assertEqual(reasons(r'(?!@{.+|{.+)[^/]+'),   [])  # lookahead is tried once per position
+        self.assertTrue('/.ssh/id' + 'a' * 4096 + '.' in findAdversarialInputs(r'/\.ssh/(id[^.]+)(?!.*\.pub)(?:/|$)'))
+
+    def test_ruleRegexpsBacktracking(self):
+        """Rules must stay fast on attacker controlled filenames up to PATH_MAX"""
+        budget = 0.25  # seconds per input
+        knownRisks = {  # quadratic within PATH_MAX; exact rewrite changes matched group
+            r'/\.ssh/(id[^.]+)(?!.*\.pub)(?:/|$)',
+        }
+        risky = set()
+        for table, regexp in iterateRuleRegexps():
+            flags = regexp.flags & re.IGNORECASE
+            if findBacktrackingRisks(regexp.pattern, flags):
+                risky.add(regexp.pattern)
+
+            for string_ in findAdversarialInputs(regexp.pattern, flags):
+                start = time.perf_counter()
+                regexp.search(string_)
+                self.assertLess(time.perf_counter() - start, budget, (table, regexp.pattern, string_[:32]))
+
+        self.assertEqual(risky, knownRisks)
+
+    @unittest.skipIf(os.getuid() != 0, 'trusted only when owned by root')
+    def test_rewriteAdaptionCache(self):
+        with tempfile.TemporaryDirectory() as dirName:
+            cachePath = f'{dirName}/adaption.cache'
+            adaptionCache['entries'].clear()
+            expected = adaptFilePath({'path': '/proc/12/maps', 'operation': {'open'}}, 'path', 'AppArmor.d')
+            self.assertEqual(rewriteAdaptionCache(cachePath), ({}, True))
+            self.assertEqual(pathlib.Path(cachePath).stat().st_mode & 0o777, 0o600)
+
+            adaptionCache['entries'].clear()
+            self.assertEqual(loadAdaptionCache(cachePath), ({}, 1))
+            misses = adaptionCache['misses']
+            self.assertEqual(adaptFilePath({'path': '/proc/12/maps', 'operation': {'open'}}, 'path', 'AppArmor.d'), expected)
+            self.assertEqual(adaptionCache['misses'], misses)
+
+            # Writable by others
+            pathlib.Path(cachePath).chmod(0o646)
+            adaptionCache['entries'].clear()
+            errors, loadedCount = loadAdaptionCache(cachePath)
+            self.assertEqual((list(errors.values()), loadedCount), ([21], 0))
+
+            # Stale rules or tool version
+            pathlib.Path(cachePath).chmod(0o600)
+            pathlib.Path(cachePath).write_text(json.dumps({'version': 'stale', 'entries': [['/a', 'default', False, '/b', [], None]]}))
+            adaptionCache['entries'].clear()
+            self.assertEqual(loadAdaptionCache(cachePath), ({}, 0))
+
+    @unittest.skipIf(os.getuid() != 0, 'trusted only when owned by root')
+    def test_rewriteIncrementalState(self):
+        with tempfile.TemporaryDirectory() as dirName:
+            statePath = pathlib.Path(dirName, 'incremental.state')
+            state = makeIncrementalState('test') | {'cursor': 'c', 'latest_timestamp': 111111}
+            self.assertEqual(rewriteIncrementalState(str(statePath), state), ({}, True))
+            self.assertEqual(statePath.stat().st_mode & 0o777, 0o600)
+            self.assertEqual(loadIncrementalState(str(statePath), 'test'), ({}, state))
+            self.assertEqual(loadIncrementalState(str(statePath), 'stale'), ({}, makeIncrementalState('stale')))
+
+            statePath.chmod(0o622)
+            errors, loadedState = loadIncrementalState(str(statePath), 'test')
+            self.assertEqual(list(errors.values()), [21])
+            self.assertEqual(loadedState, makeIncrementalState('test'))
+
+            self.assertEqual(rewriteIncrementalState(str(statePath), state), ({}, True))  # tightened again
+            self.assertEqual(statePath.stat().st_mode & 0o777, 0o600)
+
+    def test_findIncrementalStateVersion(self):
+        args = handleArgs()
+        version = findIncrementalStateVersion(args)
+        self.assertEqual(findIncrementalStateVersion(args), version)
+        self.assertEqual(findIncrementalStateVersion(argparse.Namespace(**vars(args) | {'sort': 'path'})), version)  # display only
+        self.assertNotEqual(findIncrementalStateVersion(argparse.Namespace(**vars(args) | {'style': 'both'})), version)
+        with unittest.mock.patch('pathlib.Path.read_text', side_effect=OSError):
+            self.assertIsNone(findIncrementalStateVersion(args))  # unknown boot
+
+    def test_findLiteralPrefixes(self):
+        self.assertEqual(findLiteralPrefixes(r'^/dev/sr(\d+)$'),                {'/dev/sr'})
+        self.assertEqual(findLiteralPrefixes(r'^/(?:usr/|{\,usr/})?lib/(x)'),    {'/usr/lib/x', '/{,usr/}lib/x', '/lib/x'})
+        self.assertEqual(findLiteralPrefixes(r'^(?:/proc|@{PROC})/(?!0)(\d+)'), {'/proc/', '@{PROC}/'})
+        self.assertEqual(findLiteralPrefixes(r'^/a(?:bc|de)[0-9]/'),           {'/abc', '/ade'})
+        self.assertIsNone(findLiteralPrefixes(r'/#(\d+)$'))  # not anchored
+        self.assertIsNone(findLiteralPrefixes(r'(?i)^/dev/sr(\d+)$'))  # case folded
+        self.assertIsNone(findLiteralPrefixes(r'^/(a)?(?(1)b|c)/(x)'))  # unknown opcode, full scan
+        self.assertFalse(isLineBoundRegexp(r'^/(a)?(?(1)b|c)/(x)'))
+        self.assertEqual(findRequiredLiteral(r'^/dev/(a)?(?(1)b|c)/(x)'), '')
+
+    def test_isParsedAsExpected(self):
+        for table, regexp in iterateRuleRegexps():
+            self.assertTrue(isParsedAsExpected(sre_parse.parse(regexp.pattern, regexp.flags)), regexp.pattern)
+
+        self.assertFalse(isParsedAsExpected(sre_parse.parse(r'(a)?(?(1)b|c)')))
+        self.assertFalse(isParsedAsExpected([(sre_parse.LITERAL, 'a')]))  # changed shape
+
+    def test_indexFilePathRules_linearScan(self):
+        '''Dispatched rules give the same as trying each rule, over examples derived from rule tables'''
+        for ruleStyle in ('default', 'AppArmor.d'):
+            for isUnixLine in (False, True):
+                rules, index, catchAll, keysByRule = indexFilePathRules(ruleStyle, isUnixLine)
+                examples = set()
+                for regexp, macro, prefix in rules:
+                    examples.update(findAdversarialInputs(regexp.pattern, regexp.flags, length=8))
+                    examples.add(macro)
+
+                matched = 0
+                for example in sorted(examples):
+                    candidates = index.get(findPathDispatchKey(example), catchAll)
+                    for i, (regexp, macro, prefix) in enumerate(rules):
+                        if regexp.search(example):
+                            matched += 1
+                            self.assertIn(i, candidates, (example, regexp.pattern))
+
+                    path = prepareFilePath({'path': example}, 'path')['path']
+                    for regexp, macro, prefix in rules:
+                        whatRe = regexp.search(path)
+                        if whatRe:
+                            path = substituteMatch(path, macro, whatRe)[0]
+
+                    self.assertEqual(applyFilePathRules({'path': example}, 'path', ruleStyle, isUnixLine)['path'], path)
+
+                self.assertTrue(matched)  # examples do reach the rules
+
+    def test_findPathDispatchKey(self):
+        self.assertEqual(findPathDispatchKey('/usr/lib/x'),      '/usr')
+        self.assertEqual(findPathDispatchKey('@/home/user/'),    '@/home')
+        self.assertEqual(findPathDispatchKey('@{PROC}/1/maps'),  '@{PROC}')
+        self.assertEqual(findPathDispatchKey('/usr'),            '/usr')
+        self.assertEqual(findPathDispatchKey('@abcdef'),         '@abcdef')
+
 class t_findLineType(unittest.TestCase):
 
     def setUp(self):
@@ -1414,6 +1844,23 @@ class mergeTests(unittest.TestCase):
 ]}
         self.assertEqual(mergeExactDuplicates(inpt), result)
 
+    def test_mergeLinesBySpec(self):
+        inpt = {'ping': [
+{'family': 'inet',  'sock_type': 'raw',   'mask': {'create'}, 'operation': {'create'},      'lport': {'0'}, 'fport': {'0'}, 'timestamp': 1},
+{'family': 'inet',  'sock_type': 'raw',   'mask': {'send'},   'operation': {'sendmsg'},     'lport': {'0'}, 'fport': {'0'}, 'timestamp': 2},
+{'family': 'inet',  'sock_type': 'raw',   'mask': {'create'}, 'operation': {'create'},      'lport': {'1'}, 'fport': {'0'}, 'timestamp': 3},
+{'family': 'inet',  'sock_type': 'raw',   'mask': {'send'},   'operation': {'sendmsg'},     'lport': {'1'}, 'fport': {'0'}, 'timestamp': 4},
+{'family': 'inet',  'sock_type': 'raw',   'mask': {'create'}, 'operation': {'create'},      'lport': {'0'}, 'fport': {'2'}, 'timestamp': 5},
+{'family': 'inet',  'sock_type': 'raw',   'mask': {'create'}, 'operation': {'create'},      'lport': {'1'}, 'fport': {'2'}, 'timestamp': 6},
+{'family': 'inet6', 'sock_type': 'dgram', 'mask': {'send'},   'operation': {'file_inherit'}, 'timestamp': 7},
+]}
+        result = {'ping': [
+{'family': 'inet6', 'sock_type': 'dgram', 'mask': {'send'},   'operation': {'file_inherit'}, 'timestamp': 7},
+{'family': 'inet',  'sock_type': 'raw',   'mask': {'create', 'send'}, 'operation': {'create', 'sendmsg'}, 'lport': {'0', '1'}, 'fport': {'0'}, 'timestamp': 4},
+{'family': 'inet',  'sock_type': 'raw',   'mask': {'create'}, 'operation': {'create'},      'lport': {'0', '1'}, 'fport': {'2'}, 'timestamp': 6},
+]}
+        self.assertEqual(mergeLinesBySpec(inpt, mergeSpecs['network']), result)
+
 class abstractionsTests(unittest.TestCase):
     '''Match = hide'''
     def setUp(self):
@@ -1758,6 +2205,18 @@ class abstractionsTests(unittest.TestCase):
         for t in self.allProfileTypes:
             [self.assertFalse(isBaseAbstractionTransition(l, t)) for l in self.alwaysFalse]
 
+    def test_isBaseAbstractionPath(self):
+        self.assertTrue(isBaseAbstractionPath('/dev/log',  frozenset({'w'})))
+        self.assertTrue(isBaseAbstractionPath('/dev/log',  frozenset({'a'})))  # 'w' consumes 'a'
+        self.assertFalse(isBaseAbstractionPath('/dev/log', frozenset({'r'})))
+        self.assertTrue(isBaseAbstractionPath('/usr/lib/x86_64-linux-gnu/libc.so.6',    frozenset({'m', 'r'})))
+        self.assertFalse(isBaseAbstractionPath('/usr/lib/x86_64-linux-gnu/libc.so.6',   frozenset({'m', 'r', 'a'})))
+        self.assertTrue(isBaseAbstractionPath('@{PROC}/1/maps',                         frozenset({'r'})))
+
+        rules, index, catchAll = compileBaseAbstractionRules()
+        for regexp, mask in rules:  # shared masks are immutable
+            self.assertIsInstance(mask, frozenset)
+
 class otherTests(unittest.TestCase):
 
     def setUp(self):
@@ -1866,6 +2325,57 @@ class otherTests(unittest.TestCase):
         for j,r in eventsAndLines:
             self.assertEqual(findLogLines(j, args), r)
 
+    def test_mergeIncrementally(self):
+        args = handleArgs()
+        message = 'AVC apparmor="ALLOWED" operation="{}" profile="{}" name="{}" pid=19156 comm="{}" requested_mask="{}" denied_mask="{}" fsuid=1000 ouid=1000'
+        events = [('open', 'echo', '/tmp/a', 'echo', 'r'), ('open', 'echo', '/tmp/a', 'echo', 'w'), ('mknod', 'touch', '/tmp/f', 'touch', 'c'),
+                  ('open', 'echo', '/tmp/a', 'sh', 'r'),   ('open', 'echo', '/tmp/a', 'echo', 'r'), ('open', 'echo', '/home/user/.config/a', 'echo', 'r')]
+        entries = [{'_AUDIT_TYPE_NAME': 'AVC', 'SYSLOG_IDENTIFIER': 'audit', '__REALTIME_TIMESTAMP': 111111 + i,
+                    'MESSAGE': message.format(operation, profile, name, comm, mask, mask)} for i, (operation, profile, name, comm, mask) in enumerate(events)]
+
+        def findKeyedLines(entries):
+            logLines = findLogLines(copy.deepcopy(entries), args)[0]
+            logLineIds = [findLogLineId(l) for l in logLines]
+            [normalizeProfileName(l) for l in logLines]
+            return list(zip(logLineIds, logLines))
+
+        result = mergeProfiles(groupLinesByProfile([l for lineId, l in findKeyedLines(entries)]), args)
+        state = makeIncrementalState('test')
+        for batch in (entries[:2], entries[2:5], entries[5:], []):
+            mergedLines_byStyle = mergeIncrementally(state, findKeyedLines(batch), args)
+            state = json.loads(json.dumps(encodeStateValue(state)), object_hook=decodeStateValue)
+
+        self.assertEqual(mergedLines_byStyle, result)
+
+        self.assertEqual(list(state['lines']), ['echo', 'touch'])
+        self.assertEqual(len(state['lines']['echo']), 4)  # duplicate is kept once
+
+    def test_mergeProfilesOnJobs(self):
+        allLines = {'a': [{}] * 5, 'b': [{}] * 9, 'c': [{}] * 3, 'd': [{}] * 2}
+        self.assertEqual([list(shard) for shard in shardProfiles(allLines, 2)], [['b'], ['a', 'c', 'd']])
+        self.assertEqual([list(shard) for shard in shardProfiles(allLines, 8)], [['b'], ['a'], ['c'], ['d']])
+        self.assertEqual(len(shardProfiles(allLines, 0)), 1)
+
+        args = handleArgs()
+        message = 'AVC apparmor="ALLOWED" operation="open" profile="{}" name="{}" pid=19156 comm="{}" requested_mask="r" denied_mask="r" fsuid=1000 ouid=1000'
+        entries = [{'_AUDIT_TYPE_NAME': 'AVC', 'SYSLOG_IDENTIFIER': 'audit', '__REALTIME_TIMESTAMP': 111111 + i, 'MESSAGE': message.format(*event)}
+                   for i, event in enumerate([('echo', '/tmp/a', 'echo'), ('touch', '/home/user/.config/a', 'touch'), ('echo', '/tmp/a', 'sh')])]
+
+        entries.append({'_AUDIT_TYPE_NAME': 'USER_AVC', '_SELINUX_CONTEXT': 'dbus-daemon', '__REALTIME_TIMESTAMP': 111114,
+                        'MESSAGE': 'USER_AVC pid=1695 uid=102 auid=4294967295 ses=4294967295 subj=dbus-daemon msg=\'apparmor="ALLOWED" operation="dbus_method_call"  bus="system" path="/org/freedesktop/login1/session/_41" interface="org.freedesktop.DBus.Properties" member="GetAll" mask="send" name=":1.1" pid=2166 label="gnome-shell" peer_pid=1711 peer_label="systemd-logind"\n exe="/usr/bin/dbus-daemon" sauid=102 hostname=? addr=? terminal=?\''})
+
+        logLines = findLogLines(entries, args)[0]
+        for l in logLines:
+            normalizeProfileName(l)
+
+        allLines = groupLinesByProfile(logLines)
+        result = mergeProfiles(copy.deepcopy(allLines), args)
+        args.jobs = 2
+        self.assertEqual(mergeProfilesOnJobs(copy.deepcopy(allLines), args), result)
+        args.jobs_split = 'types'
+        self.assertEqual(mergeProfilesOnJobs(copy.deepcopy(allLines), args), result)
+        self.assertEqual(result['default'][1]['gnome-shell'][0]['path_diffs'], [[(32, 33), '_41']])  # DBus line merged on job
+
 if __name__ == '__main__':
 
     unittest.main()